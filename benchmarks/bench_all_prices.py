@@ -0,0 +1,81 @@
+"""
+Time the "all" prices and their region -> type -> utilization index, fetching
+the price types one after another and merging the region lists (as the CLI used
+to) versus get_prices_by_region, against a local server with injected latency.
+
+    python benchmarks/bench_all_prices.py [--latency 0.05] [--regions 10] [--sizes 40]
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+from localserver import LocalPricingServer, add_all_price_types, make_elb_payload
+
+import ec2instancespricing as ec2p
+
+
+TYPES = ("ondemand", "reserved", "spot", "elb", "emr")
+
+
+def one_type_at_a_time():
+    data = {"config": {"currency": ec2p.DEFAULT_CURRENCY, "unit": "perhr"}, "regions": []}
+    for type in TYPES:
+        data = ec2p.merge_instances(data, ec2p.get_ec2_instances_prices(ec2p.INSTANCES_URLS_BY_TYPE[type], type, filter_os_type="linux"))
+
+    index = {}
+    for r in data["regions"]:
+        for t in r["instanceTypes"]:
+            index.setdefault(r["region"], {}).setdefault(t["type"], {})[t["utilization"]] = t
+
+    return data, index
+
+
+def measure(label, fn, rounds):
+    best = None
+    for _ in range(rounds):
+        ec2p._clear_parse_memo()
+        start = time.time()
+        result = fn()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print("%-22s %7.3fs" % (label, best))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.05, help="Injected per-request latency in seconds")
+    parser.add_argument("--regions", type=int, default=10)
+    parser.add_argument("--sizes", type=int, default=40)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    regions = ["us-east-1", "us-west-2"] + ["region-%d" % i for i in range(args.regions - 2)]
+    for r in regions:
+        ec2p.JSON_NAME_TO_EC2_REGIONS_API.setdefault(r, r)
+    sizes = ["m3.large"] + ["m%d.%dxlarge" % (i % 10, i) for i in range(args.sizes - 1)]
+
+    with LocalPricingServer(latency=args.latency) as server:
+        urls = add_all_price_types(server, regions, sizes)
+        urls["elb"] = [server.add("/elb.js", make_elb_payload(regions))]
+        ec2p.INSTANCES_URLS_BY_TYPE.update(urls)
+
+        old_data, old_index = measure("one type at a time", one_type_at_a_time, args.rounds)
+        data, index = measure("get_prices_by_region", lambda: ec2p.get_prices_by_region(TYPES, filter_os_type="linux"), args.rounds)
+
+        assert index == old_index
+
+        # same instance types, grouped under a single entry per region
+        grouped = {}
+        for r in old_data["regions"]:
+            grouped.setdefault(r["region"], []).extend(r["instanceTypes"])
+        assert dict((r["region"], r["instanceTypes"]) for r in data["regions"]) == grouped
+        assert len(data["regions"]) == len(grouped)
+
+        print("regions: %d entries before, %d after" % (len(old_data["regions"]), len(data["regions"])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+Compare serial and concurrent fetching in get_ec2_instances_prices against a
+local server with injected latency.
+
+    python benchmarks/bench_concurrent_fetch.py [--latency 0.2] [--files 18]
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+from localserver import LocalPricingServer, make_payload
+
+import ec2instancespricing as ec2p
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.2, help="Injected per-request latency in seconds")
+    parser.add_argument("--files", type=int, default=18, help="Number of pricing files to fetch")
+    args = parser.parse_args()
+
+    with LocalPricingServer(latency=args.latency) as server:
+        urls = [server.add("/pricing/%d.js" % i, make_payload()) for i in range(args.files)]
+
+        baseline = None
+        for max_concurrency in (1, 2, 4, 8, 16):
+            start = time.time()
+            result = ec2p.get_ec2_instances_prices(urls, "spot", max_concurrency=max_concurrency)
+            elapsed = time.time() - start
+
+            if baseline is None:
+                baseline = (elapsed, result)
+            assert result == baseline[1], "results differ from the serial fetch"
+
+            print("max_concurrency=%-3d %7.3fs  speedup x%.1f" % (max_concurrency, elapsed, baseline[0] / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+CPU time and peak memory of a single region / single instance type query on
+the reserved files, parsing everything (as the results cache does) versus
+pushing the filters down into the parse.
+
+    python benchmarks/bench_filter_pushdown.py [--regions 20] [--sizes 80]
+"""
+from __future__ import print_function
+
+import argparse
+import time
+import tracemalloc
+
+from localserver import LocalPricingServer, RESERVED_COLUMNS, make_payload
+
+import ec2instancespricing as ec2p
+
+
+def measure(label, fn, rounds):
+    start = time.time()
+    for _ in range(rounds):
+        ec2p._clear_parse_memo()
+        result = fn()
+    elapsed = (time.time() - start) / rounds
+
+    ec2p._clear_parse_memo()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print("%-38s %7.3fs %8.1f MB peak" % (label, elapsed, peak / 1e6))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--regions", type=int, default=20)
+    parser.add_argument("--sizes", type=int, default=80)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    regions = ["us-east-1", "us-west-2"] + ["region-%d" % i for i in range(args.regions - 2)]
+    for r in regions:
+        ec2p.JSON_NAME_TO_EC2_REGIONS_API.setdefault(r, r)
+    sizes = ["m3.large"] + ["m%d.%dxlarge" % (i % 10, i) for i in range(args.sizes - 1)]
+
+    with LocalPricingServer() as server:
+        urls = []
+        for utilization in ("light", "medium", "heavy"):
+            for os_name in ("linux", "rhel", "sles", "mswin", "mswinSQL", "mswinSQLWeb"):
+                u = server.add("/reserved/%s-%s.js" % (os_name, utilization), make_payload(regions, sizes, RESERVED_COLUMNS))
+                ec2p.INSTANCES_RESERVED_OS_TYPE_BY_URL[u] = os_name
+                ec2p.INSTANCES_RESERVED_UTILIZATION_TYPE_BY_URL[u] = utilization
+                urls.append(u)
+
+        # warm up the HTTP connections
+        ec2p._load_data_many(urls)
+
+        for label, filters in [("region us-west-2", {"filter_region": "us-west-2"}), ("instance type m3.large", {"filter_instance_type": "m3.large"})]:
+            # use_cache parses whole files so any filter can be answered from the cache
+            full = measure("%s, full parse" % label, lambda: ec2p.get_ec2_instances_prices(urls, "reserved", use_cache=True, cache_class=ec2p.ResultsCacheBase, **filters), args.rounds)
+            pushed = measure("%s, pushed down" % label, lambda: ec2p.get_ec2_instances_prices(urls, "reserved", **filters), args.rounds)
+            assert full == pushed
+
+
+if __name__ == "__main__":
+    main()
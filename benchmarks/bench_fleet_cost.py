@@ -0,0 +1,113 @@
+"""
+Rows per second of pricing a synthetic inventory, totals and per region costs
+included: a per row dict lookup loop versus fleet_cost, with NumPy (when
+it's installed) and with its pure Python fallback.
+
+    python benchmarks/bench_fleet_cost.py [--rows 100000,500000]
+"""
+from __future__ import print_function
+
+import argparse
+import random
+import time
+
+import localserver  # noqa: F401, puts ec2instancespricing on sys.path
+
+import ec2instancespricing as ec2p
+
+
+def make_prices(regions, sizes):
+    records = []
+    for region in regions:
+        for i, size in enumerate(sizes):
+            for os_name in ("linux", "rhel", "sles", "mswin"):
+                hourly = 0.01 * (i + 1)
+                records.append(ec2p.PriceRecord(region, size, os_name, "ondemand", "ondemand", hourly, None))
+                records.append(ec2p.PriceRecord(region, size, os_name, "spot", "spot", hourly / 3, None))
+                for utilization in ("light", "medium", "heavy"):
+                    records.append(ec2p.PriceRecord(region, size, os_name, utilization, "1year", hourly / 2, 100.0 * (i + 1)))
+                    records.append(ec2p.PriceRecord(region, size, os_name, utilization, "3year", hourly / 4, 150.0 * (i + 1)))
+
+    return records
+
+
+def make_inventory(records, rows):
+    rng = random.Random(rows)
+    keys = [record[:5] for record in records]
+    inventory = dict((name, []) for name in ec2p.INVENTORY_FIELD_NAMES)
+    for _ in range(rows):
+        for name, value in zip(ec2p.INVENTORY_FIELD_NAMES, rng.choice(keys)):
+            inventory[name].append(value)
+        inventory["count"].append(rng.randint(1, 20))
+        inventory["hours"].append(rng.choice((730, 365, 24)))
+
+    return inventory
+
+
+def per_row(inventory, records):
+    """ The dict lookup loop fleet_cost replaces """
+    prices = dict((record[:5], {"hourly": record.hourly, "upfront_perGB": record.upfront}) for record in records)
+
+    by_region = {}
+    total = 0.0
+    for region, type, os_name, utilization, term, count, hours in zip(*[inventory[name] for name in ec2p.INVENTORY_FIELD_NAMES]):
+        price = prices.get((region, type, os_name, utilization, term))
+        if price is None:
+            continue
+        rate = price["hourly"] or 0.0
+        if price["upfront_perGB"] is not None and term in ec2p.RESERVED_TERM_HOURS:
+            rate += price["upfront_perGB"] / float(ec2p.RESERVED_TERM_HOURS[term])
+        monthly = rate * count * hours
+        by_region[region] = by_region.get(region, 0.0) + monthly
+        total += monthly
+
+    return total
+
+
+def vectorized(inventory, table):
+    costs = ec2p.fleet_cost(inventory, table)
+    costs.by("region")
+    return costs.total().monthly
+
+
+def measure(label, fn, rows, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.time()
+        result = fn()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print("  %-24s %7.3fs %12.0f rows/s" % (label, best, rows / best))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default="100000,500000", help="Comma separated inventory sizes")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    records = make_prices(["region-%d" % i for i in range(20)], ["m%d.%dxlarge" % (i % 10, i) for i in range(150)])
+    table = ec2p.PriceTable(records)
+    numpy = ec2p._numpy()
+
+    for rows in [int(r) for r in args.rows.split(",")]:
+        inventory = make_inventory(records, rows)
+        print("%d rows" % rows)
+
+        expected = measure("per row lookups", lambda: per_row(inventory, records), rows, args.rounds)
+
+        ec2p.numpy = None
+        python_table = ec2p.PriceTable(records)
+        result = measure("fleet_cost, pure Python", lambda: vectorized(inventory, python_table), rows, args.rounds)
+        assert abs(result - expected) <= 1e-6 * expected
+        ec2p.numpy = numpy
+
+        if numpy is not None:
+            result = measure("fleet_cost, NumPy", lambda: vectorized(inventory, table), rows, args.rounds)
+            assert abs(result - expected) <= 1e-6 * expected
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Compare one urlopen per file with the pooled keep-alive client used by
+_load_data and print its per-host connection statistics.
+
+    python benchmarks/bench_http_pool.py [--files 27]
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+from localserver import LocalPricingServer, make_payload
+
+import ec2instancespricing as ec2p
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=27, help="Number of pricing files to fetch")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    with LocalPricingServer() as server:
+        payload = make_payload(regions=["region-%d" % i for i in range(10)], sizes=["m%d.large" % i for i in range(20)])
+        urls = [server.add("/pricing/%d.js" % i, payload) for i in range(args.files)]
+
+        start = time.time()
+        for _ in range(args.rounds):
+            for u in urls:
+                ec2p.urllib2.urlopen(u).read()
+        print("urlopen per file  %7.3fs" % (time.time() - start))
+
+        start = time.time()
+        for _ in range(args.rounds):
+            for u in urls:
+                ec2p._http_pool.request(u)
+        print("pooled keep-alive %7.3fs" % (time.time() - start))
+
+        for host, stats in sorted(ec2p.get_http_connection_stats().items()):
+            print("%s %r" % (host, stats))
+
+
+if __name__ == "__main__":
+    main()
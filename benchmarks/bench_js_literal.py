@@ -0,0 +1,54 @@
+"""
+Compare the throughput of fixup_js_literal and fixup_js_literal_with_comments
+in MB/s (tests/test_js_literal.py checks their output is equivalent).
+
+    python benchmarks/bench_js_literal.py [recorded.js ...]
+
+Recorded pricing files can be passed on the command line, otherwise a
+synthetic payload (with comments and trailing commas) is used.
+"""
+from __future__ import print_function
+
+import io
+import re
+import sys
+import time
+
+from localserver import make_payload
+
+import ec2instancespricing as ec2p
+
+
+def _strip(request):
+    request = re.sub(re.compile(r'/\*.*\*/\n', re.DOTALL), '', request)
+    request = re.sub(r'^callback\(', '', request)
+    return re.sub(r'\);*$', '', request)
+
+
+def _synthetic():
+    payload = make_payload(regions=["region-%d" % i for i in range(20)], sizes=["m%d.large" % i for i in range(40)], os_names=("linux", "mswin", "rhel", "sles"))
+    # sprinkle in the constructs the tokenize based fixup handles
+    payload = payload.replace("valueColumns:[", "valueColumns:[ // columns\n").replace("]}", ",]/* end */}")
+    return payload
+
+
+def _throughput(fixup, text, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        fixup(text)
+    elapsed = time.time() - start
+    return (len(text.encode("utf8")) * repeat) / elapsed / (1024 * 1024)
+
+
+def main(paths):
+    fixtures = [(p, io.open(p, encoding="utf8").read()) for p in paths] or [("synthetic", _synthetic())]
+
+    for name, payload in fixtures:
+        text = _strip(payload)
+        print("%s (%d KB)" % (name, len(text) // 1024))
+        print("  tokenize  %8.2f MB/s" % _throughput(ec2p.fixup_js_literal_with_comments, text, 3))
+        print("  lexer     %8.2f MB/s" % _throughput(ec2p.fixup_js_literal, text, 3))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
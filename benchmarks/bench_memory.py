@@ -0,0 +1,53 @@
+"""
+Compare the memory held by a --type all result built from plain dicts and
+from compact InstanceTypePrice records.
+
+    python benchmarks/bench_memory.py [--regions 25] [--sizes 120]
+"""
+from __future__ import print_function
+
+import argparse
+import gc
+import tracemalloc
+
+from localserver import LocalPricingServer, add_all_price_types
+
+import ec2instancespricing as ec2p
+
+
+def _build(urls, compact):
+    return [ec2p.get_ec2_instances_prices(u, type, use_cache=True, compact=compact) for type, u in sorted(urls.items())]
+
+
+def _measure(urls, compact):
+    gc.collect()
+    tracemalloc.start()
+    result = _build(urls, compact)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rows = sum(len(r["instanceTypes"]) for data in result for r in data["regions"])
+    return rows, current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--regions", type=int, default=25)
+    parser.add_argument("--sizes", type=int, default=120)
+    args = parser.parse_args()
+
+    regions = list(ec2p.JSON_NAME_TO_EC2_REGIONS_API)[:args.regions]
+    sizes = ["m%d.%dxlarge" % (i % 7, i) for i in range(args.sizes)]
+
+    with LocalPricingServer() as server:
+        urls = add_all_price_types(server, regions, sizes)
+        # warm the results cache so only the result itself is measured
+        _build(urls, False)
+
+        for compact in (False, True):
+            rows, current, peak = _measure(urls, compact)
+            print("%-8s rows=%-7d retained=%8.1f MB  peak=%8.1f MB" % ("compact" if compact else "dicts", rows, current / 1048576.0, peak / 1048576.0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Throughput of parsing and transforming the reserved pricing files in the
+calling process (threads only) and in a pool of 1, 2, 4 and 8 processes.
+
+    python benchmarks/bench_process_pool.py [--regions 20] [--sizes 80]
+
+Every file gets a distinct comment header so the parse memo can't skip work.
+"""
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import time
+
+from localserver import LocalPricingServer, RESERVED_COLUMNS, make_payload
+
+import ec2instancespricing as ec2p
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--regions", type=int, default=20)
+    parser.add_argument("--sizes", type=int, default=80)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--workers", default="1,2,4,8")
+    args = parser.parse_args()
+
+    regions = ["region-%d" % i for i in range(args.regions)]
+    for r in regions:
+        ec2p.JSON_NAME_TO_EC2_REGIONS_API[r] = r
+    sizes = ["m%d.%dxlarge" % (i % 10, i) for i in range(args.sizes)]
+
+    with LocalPricingServer() as server:
+        urls = []
+        total_bytes = 0
+        for utilization in ("light", "medium", "heavy"):
+            for os_name in ("linux", "rhel", "sles", "mswin", "mswinSQL", "mswinSQLWeb"):
+                payload = make_payload(regions, sizes, RESERVED_COLUMNS).replace("/* generated */", "/* %s %s */" % (os_name, utilization))
+                u = server.add("/reserved/%s-%s.js" % (os_name, utilization), payload)
+                ec2p.INSTANCES_RESERVED_OS_TYPE_BY_URL[u] = os_name
+                ec2p.INSTANCES_RESERVED_UTILIZATION_TYPE_BY_URL[u] = utilization
+                urls.append(u)
+                total_bytes += len(payload)
+
+        print("%d files, %.1f MB, %d CPUs" % (len(urls), total_bytes / 1e6, multiprocessing.cpu_count()))
+
+        for workers in [None] + [int(w) for w in args.workers.split(",")]:
+            ec2p.PARSE_PROCESSES = workers
+            # warm up the pool (and the HTTP connections)
+            expected = ec2p.get_ec2_instances_prices(urls, "reserved")
+
+            start = time.time()
+            for _ in range(args.rounds):
+                ec2p._clear_parse_memo()
+                result = ec2p.get_ec2_instances_prices(urls, "reserved")
+            elapsed = (time.time() - start) / args.rounds
+            assert result == expected
+
+            print("%-12s %7.3fs %6.1f files/s %6.1f MB/s" % ("in process" if workers is None else "%d processes" % workers, elapsed, len(urls) / elapsed, total_bytes / 1e6 / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Measure refreshing expired TimeBasedResultsCache entries when the server
+answers 304 Not Modified, when the unchanged body is downloaded again (and
+its parse is reused by content hash) and when everything is reparsed.
+
+    python benchmarks/bench_revalidation.py [--files 18]
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+from localserver import LocalPricingServer, make_payload
+
+import ec2instancespricing as ec2p
+
+
+def _expire_all():
+    cache = ec2p.TimeBasedResultsCache()
+    for key in list(cache._cache_expiration):
+        cache._cache_expiration[key] = ec2p.datetime.datetime.utcnow() - ec2p.datetime.timedelta(seconds=1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=18, help="Number of pricing files to refresh")
+    args = parser.parse_args()
+
+    with LocalPricingServer() as server:
+        sizes = ["m%d.large" % i for i in range(40)]
+        urls = [server.add("/pricing/%d.js" % i, make_payload(regions=["region-%d-%d" % (i, j) for j in range(20)], sizes=sizes)) for i in range(args.files)]
+
+        def refresh():
+            start = time.time()
+            for u in urls:
+                ec2p._load_data(u, use_cache=True, cache_class=ec2p.TimeBasedResultsCache)
+            return time.time() - start
+
+        print("cold fetch           %7.3fs" % refresh())
+
+        _expire_all()
+        print("revalidated (304)    %7.3fs  not modified: %d" % (refresh(), server.not_modified))
+
+        _expire_all()
+        ec2p.TimeBasedResultsCache._cache_validators.clear()
+        print("refetch, memoized    %7.3fs" % refresh())
+
+        _expire_all()
+        ec2p.TimeBasedResultsCache._cache_validators.clear()
+        ec2p._clear_parse_memo()
+        print("refetch and reparse  %7.3fs" % refresh())
+
+
+if __name__ == "__main__":
+    main()
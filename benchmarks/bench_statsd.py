@@ -0,0 +1,45 @@
+"""
+Send price gauges to a local UDP listener, one datagram per gauge (like piping
+the statsd output format through netcat) and batched by StatsdClient.
+
+    python benchmarks/bench_statsd.py [--gauges 20000]
+"""
+from __future__ import print_function
+
+import argparse
+import socket
+import time
+
+from localserver import UDPListener
+
+import ec2instancespricing as ec2p
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--gauges", type=int, default=20000)
+    args = parser.parse_args()
+
+    records = [ec2p.PriceRecord("region-%d" % (i % 20), "m%d.large" % (i // 20), "linux", "spot", "spot", 0.001 * i, None) for i in range(args.gauges)]
+    listener = UDPListener()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    start = time.time()
+    for record in records:
+        sock.sendto(("%s:%s|g" % (ec2p.statsd_metric_name("ec2", record), record.hourly)).encode('utf8'), ("127.0.0.1", listener.port))
+    elapsed = time.time() - start
+    listener.wait_for(args.gauges)
+    print("one per datagram %7.3fs %6d datagrams %6d/%d gauges received" % (elapsed, listener.datagrams, listener.lines, args.gauges))
+
+    listener.reset()
+    start = time.time()
+    with ec2p.StatsdClient("127.0.0.1", listener.port) as statsd:
+        for record in records:
+            statsd.gauge(ec2p.statsd_metric_name("ec2", record), record.hourly)
+    elapsed = time.time() - start
+    listener.wait_for(args.gauges)
+    print("StatsdClient     %7.3fs %6d datagrams %6d/%d gauges received, largest datagram %d bytes" % (elapsed, listener.datagrams, listener.lines, args.gauges, listener.largest))
+
+
+if __name__ == "__main__":
+    main()
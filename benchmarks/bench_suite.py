@@ -0,0 +1,201 @@
+"""
+Per-stage benchmark of the pricing pipeline against a local HTTP stand-in.
+
+For every fixture and scale it reports the time and peak memory of each
+stage: fetch, strip, fixup, json, transform and format.
+
+    python benchmarks/bench_suite.py                          # run and print
+    python benchmarks/bench_suite.py --save-baseline FILE     # store the results
+    python benchmarks/bench_suite.py --check-baseline FILE    # exit 1 on regressions
+    python benchmarks/bench_suite.py --record DIR             # download the real pricing files
+
+Fixtures are the recorded pricing files in --fixtures (default
+benchmarks/fixtures, see --record), or built-in synthetic payloads in the
+same format when that directory does not exist. Scales: 1x, 10x (ten
+times the regions) and 100x (ten times the regions and the sizes).
+"""
+from __future__ import print_function
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from localserver import LocalPricingServer, RESERVED_COLUMNS, make_elb_payload, make_payload, scale_payload
+
+import ec2instancespricing as ec2p
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SCALES = {
+    "1x": (1, 1),
+    "10x": (10, 1),
+    "100x": (10, 10),
+}
+
+STAGES = ["fetch", "strip", "fixup", "json", "transform", "format"]
+
+
+def _type_of_url(url):
+    for type, urls in ec2p.INSTANCES_URLS_BY_TYPE.items():
+        if url in urls:
+            return type
+    return None
+
+
+def record(directory):
+    """ Download every pricing file into directory """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    for urls in ec2p.INSTANCES_URLS_BY_TYPE.values():
+        for url in urls:
+            body, _ = ec2p._download(url)
+            with open(os.path.join(directory, url.rsplit("/", 1)[1]), "wb") as f:
+                f.write(body)
+            print("recorded %s" % url)
+
+
+def load_fixtures(directory):
+    """ [(name, original url, text)] of the recorded files, or synthetic ones """
+    if os.path.isdir(directory):
+        by_name = dict((u.rsplit("/", 1)[1], u) for urls in ec2p.INSTANCES_URLS_BY_TYPE.values() for u in urls)
+        fixtures = []
+        for name in sorted(os.listdir(directory)):
+            if name in by_name:
+                fixtures.append((name, by_name[name], io.open(os.path.join(directory, name), encoding="utf8").read()))
+        return fixtures
+
+    regions = ["us-east", "us-west-2", "eu-west-1", "eu-central-1", "ap-southeast-2", "ap-northeast-1", "sa-east-1", "ca-central-1"]
+    spot_regions = ["us-east", "us-west-2", "eu-ireland", "eu-central-1", "apac-syd", "apac-tokyo", "sa-east-1", "ca-central-1"]
+    sizes = ["%s%d.%s" % (family, generation, size) for family in ("m", "c", "r") for generation in (3, 4) for size in ("large", "xlarge", "2xlarge", "4xlarge", "8xlarge")]
+    return [
+        ("synthetic-linux-od", ec2p.INSTANCES_ON_DEMAND_LINUX_URL, make_payload(regions, sizes, ("linux",))),
+        ("synthetic-linux-ri-heavy", ec2p.INSTANCES_RESERVED_HEAVY_UTILIZATION_LINUX_URL, make_payload(regions, sizes, RESERVED_COLUMNS)),
+        ("synthetic-spot", ec2p.INSTANCES_SPOT_INSTANCE_URL, make_payload(spot_regions, sizes, ("linux", "mswin"))),
+        ("synthetic-elb", ec2p.INSTANCES_ELB_URL, make_elb_payload(regions)),
+        ("synthetic-emr", ec2p.INSTANCES_USED_BY_EMR_URL, make_payload(regions, sizes, ("ec2", "emr"))),
+    ]
+
+
+def _format(result):
+    lines = []
+    for r in result["regions"]:
+        for it in r["instanceTypes"]:
+            for term in it["prices"]:
+                lines.append("%s,%s,%s,%s,%s,%s,%s" % (r["region"], it["type"], it["os"], ec2p.none_as_string(it["prices"][term]["hourly"]), it["utilization"], term, ec2p.none_as_string(it["prices"][term]["upfront_perGB"])))
+    return "\n".join(lines)
+
+
+def run_stages(url, type, measure):
+    """ Run the pipeline stage by stage, measure(stage, fn, *args) returns fn's result """
+    body = measure("fetch", lambda: ec2p._download(url)[0])
+    stripped = measure("strip", ec2p._strip_payload, body)
+    fixed = measure("fixup", ec2p.JS_LITERAL_FIXUP, stripped)
+    obj = measure("json", json.loads, fixed)
+    result = measure("transform", lambda: ec2p._build_instances_prices(ec2p._iter_payloads_regions([url], [obj], type)))
+    measure("format", _format, result)
+
+
+def benchmark(url, type, repeat):
+    stats = dict((stage, {"seconds": None, "peak_bytes": 0}) for stage in STAGES)
+
+    def timed(stage, fn, *args):
+        start = time.time()
+        result = fn(*args)
+        elapsed = time.time() - start
+        if stats[stage]["seconds"] is None or elapsed < stats[stage]["seconds"]:
+            stats[stage]["seconds"] = elapsed
+        return result
+
+    def traced(stage, fn, *args):
+        tracemalloc.start()
+        result = fn(*args)
+        stats[stage]["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result
+
+    for _ in range(repeat):
+        run_stages(url, type, timed)
+    # memory is measured separately, tracing slows everything down
+    run_stages(url, type, traced)
+
+    return stats
+
+
+def check(results, baseline, tolerance):
+    """ Names of the measurements that regressed more than tolerance """
+    regressions = []
+    for name, stages in sorted(results.items()):
+        for stage, stats in sorted(stages.items()):
+            base = baseline.get(name, {}).get(stage)
+            if base is None:
+                continue
+
+            # ignore sub-millisecond noise
+            if stats["seconds"] > base["seconds"] * (1 + tolerance) and stats["seconds"] - base["seconds"] > 0.001:
+                regressions.append("%s %s: %.4fs (baseline %.4fs)" % (name, stage, stats["seconds"], base["seconds"]))
+            if stats["peak_bytes"] > base["peak_bytes"] * (1 + tolerance) and stats["peak_bytes"] - base["peak_bytes"] > 65536:
+                regressions.append("%s %s: %d bytes peak (baseline %d)" % (name, stage, stats["peak_bytes"], base["peak_bytes"]))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixtures", default=os.path.join(HERE, "fixtures"), help="Directory of recorded pricing files")
+    parser.add_argument("--record", metavar="DIR", help="Download the real pricing files into DIR and exit")
+    parser.add_argument("--scales", default="1x,10x,100x", help="Comma separated scales out of %s" % ", ".join(sorted(SCALES)))
+    parser.add_argument("--repeat", type=int, default=3, help="Timing runs per measurement (the fastest is kept)")
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--check-baseline", metavar="FILE")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before --check-baseline fails")
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record)
+        return 0
+
+    results = {}
+    with LocalPricingServer() as server:
+        for name, original_url, text in load_fixtures(args.fixtures):
+            type = _type_of_url(original_url)
+            for scale in args.scales.split(","):
+                region_factor, size_factor = SCALES[scale]
+                url = server.add("/%s/%s" % (scale, name), scale_payload(text, region_factor, size_factor) if scale != "1x" else text)
+
+                # the transform looks up OS and utilization by url
+                if original_url in ec2p.INSTANCES_ONDEMAND_OS_TYPE_BY_URL:
+                    ec2p.INSTANCES_ONDEMAND_OS_TYPE_BY_URL[url] = ec2p.INSTANCES_ONDEMAND_OS_TYPE_BY_URL[original_url]
+                if original_url in ec2p.INSTANCES_RESERVED_OS_TYPE_BY_URL:
+                    ec2p.INSTANCES_RESERVED_OS_TYPE_BY_URL[url] = ec2p.INSTANCES_RESERVED_OS_TYPE_BY_URL[original_url]
+                    ec2p.INSTANCES_RESERVED_UTILIZATION_TYPE_BY_URL[url] = ec2p.INSTANCES_RESERVED_UTILIZATION_TYPE_BY_URL[original_url]
+
+                key = "%s@%s" % (name, scale)
+                results[key] = benchmark(url, type, args.repeat)
+
+                print(key)
+                for stage in STAGES:
+                    print("  %-10s %9.4fs %10.1f KB peak" % (stage, results[key][stage]["seconds"], results[key][stage]["peak_bytes"] / 1024.0))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.check_baseline:
+        with open(args.check_baseline) as f:
+            regressions = check(results, json.load(f), args.tolerance)
+
+        for regression in regressions:
+            print("REGRESSION %s" % regression)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""
+Local HTTP stand-in for the AWS pricing endpoints (and a UDP listener standing
+in for statsd) used by the benchmarks and the tests.
+
+Payloads are registered by path and served with an optional injected latency
+so network-bound behaviour can be measured without touching AWS.
+"""
+from __future__ import print_function
+
+import gzip
+import hashlib
+import io
+import os
+import socket
+import sys
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ec2instancespricing"))
+
+
+def make_payload(regions=("us-east", "us-west-2", "eu-ireland"), sizes=("m1.small", "m1.large", "c3.xlarge"), os_names=("linux", "mswin")):
+    """ Build a callback(...) wrapped JS literal shaped like the on-demand/spot pricing files """
+    region_literals = []
+    for region in regions:
+        size_literals = []
+        for size in sizes:
+            columns = ",".join("{name:'%s',prices:{USD:'%.3f'}}" % (os_name, 0.05 + i * 0.01) for i, os_name in enumerate(os_names))
+            size_literals.append("{size:'%s',valueColumns:[%s]}" % (size, columns))
+        region_literals.append("{region:'%s',instanceTypes:[{type:'generalCurrentGen',sizes:[%s]}]}" % (region, ",".join(size_literals)))
+
+    return "/* generated */\ncallback({vers:0.01,config:{rate:'perhr',valueColumns:['linux'],currencies:['USD'],regions:[%s]}});" % ",".join(region_literals)
+
+
+def _gzip(body):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb") as f:
+        f.write(body)
+    return buf.getvalue()
+
+
+RESERVED_COLUMNS = ("yrTerm1", "yrTerm1Hourly", "yrTerm3", "yrTerm3Hourly")
+
+
+def make_elb_payload(regions=("us-east", "us-west-2", "eu-ireland")):
+    """ Build a callback(...) wrapped JS literal shaped like the ELB pricing file """
+    region_literals = []
+    for region in regions:
+        region_literals.append("{region:'%s',types:[{values:[{rate:'perELBHour',prices:{USD:'0.025'}},{rate:'perGBProcessed',prices:{USD:'0.008'}}]}]}" % region)
+
+    return "/* generated */\ncallback({vers:0.01,config:{currencies:['USD'],regions:[%s]}});" % ",".join(region_literals)
+
+
+def scale_payload(text, region_factor=1, size_factor=1):
+    """ Multiply the regions and the sizes of every instance type of a pricing payload.
+
+    Copies get a "-s<n>" suffix (regions are registered in JSON_NAME_TO_EC2_REGIONS_API
+    so the transform accepts them). The result is serialized back to a JS literal
+    with unquoted keys so the fixup stage still has work to do.
+    """
+    import copy
+    import json
+    import re
+
+    import ec2instancespricing as ec2p
+
+    obj = ec2p._parse_payload(text)
+    regions = obj["config"]["regions"]
+
+    for r in regions:
+        for t in r.get("instanceTypes", r.get("types", [])):
+            if "sizes" in t:
+                sizes = t["sizes"]
+                t["sizes"] = list(sizes)
+                for n in range(1, size_factor):
+                    for size in sizes:
+                        size = copy.deepcopy(size)
+                        size["size"] = "%s-s%d" % (size["size"], n)
+                        t["sizes"].append(size)
+
+    scaled = list(regions)
+    for n in range(1, region_factor):
+        for r in regions:
+            r = copy.deepcopy(r)
+            r["region"] = "%s-s%d" % (r["region"], n)
+            ec2p.JSON_NAME_TO_EC2_REGIONS_API[r["region"]] = r["region"]
+            scaled.append(r)
+    obj["config"]["regions"] = scaled
+
+    literal = re.sub(r'"(\w+)":', r'\1:', json.dumps(obj, separators=(",", ":")))
+    return "/* scaled x%d regions, x%d sizes */\ncallback(%s);" % (region_factor, size_factor, literal)
+
+
+def add_all_price_types(server, regions, sizes):
+    """ Register synthetic payloads for every price type, returns {type: urls}.
+
+    The on-demand and reserved URLs are added to the module's OS / utilization
+    by URL tables, so get_ec2_instances_prices can be pointed at them directly.
+    """
+    import ec2instancespricing as ec2p
+
+    urls = {}
+    urls["ondemand"] = []
+    for os_name in ("linux", "rhel", "sles", "mswin", "mswinSQL", "mswinSQLWeb"):
+        u = server.add("/ondemand/%s.js" % os_name, make_payload(regions, sizes, (os_name,)))
+        ec2p.INSTANCES_ONDEMAND_OS_TYPE_BY_URL[u] = os_name
+        urls["ondemand"].append(u)
+
+    urls["reserved"] = []
+    for utilization in ("light", "medium", "heavy"):
+        for os_name in ("linux", "rhel", "sles", "mswin", "mswinSQL", "mswinSQLWeb"):
+            u = server.add("/reserved/%s-%s.js" % (os_name, utilization), make_payload(regions, sizes, RESERVED_COLUMNS))
+            ec2p.INSTANCES_RESERVED_OS_TYPE_BY_URL[u] = os_name
+            ec2p.INSTANCES_RESERVED_UTILIZATION_TYPE_BY_URL[u] = utilization
+            urls["reserved"].append(u)
+
+    urls["spot"] = [server.add("/spot.js", make_payload(regions, sizes, ("linux", "mswin")))]
+    urls["emr"] = [server.add("/emr.js", make_payload(regions, sizes, ("ec2", "emr")))]
+    return urls
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, so connection reuse can be measured
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        body = server.payloads.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if not isinstance(body, bytes):
+            body = body.encode("utf8")
+
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        server.requests.append(self.path)
+        if self.headers.get("If-None-Match") == etag:
+            server.not_modified += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+        if gzipped:
+            body = _gzip(body)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/javascript")
+        self.send_header("ETag", etag)
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class LocalPricingServer(object):
+    """ Serve registered payloads on 127.0.0.1 from a background thread """
+
+    def __init__(self, latency=0.0):
+        self._server = _ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.latency = latency
+        self._server.payloads = {}
+        self._server.requests = []
+        self._server.not_modified = 0
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:%d" % self._server.server_address[1]
+
+    @property
+    def requests(self):
+        """ Paths of every GET served so far """
+        return self._server.requests
+
+    @property
+    def not_modified(self):
+        """ Number of 304 Not Modified answers """
+        return self._server.not_modified
+
+    def add(self, path, body):
+        self._server.payloads[path] = body
+        return self.base_url + path
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class UDPListener(object):
+    """ Counts the datagrams and newline separated lines it receives """
+
+    def __init__(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.settimeout(0.5)
+        self.port = self.socket.getsockname()[1]
+        self.datagrams = 0
+        self.lines = 0
+        self.largest = 0
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                data = self.socket.recv(65536)
+            except socket.timeout:
+                continue
+            except socket.error:
+                return
+            self.datagrams += 1
+            self.lines += data.count(b"\n") + 1
+            self.largest = max(self.largest, len(data))
+
+    def wait_for(self, lines, timeout=5):
+        deadline = time.time() + timeout
+        while self.lines < lines and time.time() < deadline:
+            time.sleep(0.01)
+
+    def reset(self):
+        self.datagrams = self.lines = self.largest = 0
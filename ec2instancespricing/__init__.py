@@ -1 +1 @@
-from ec2instancespricing import get_prices
+from .ec2instancespricing import get_prices
@@ -0,0 +1,72 @@
+"""
+asyncio counterparts of the get_*_prices functions (Python 3.7+).
+
+Every URL is fetched concurrently on worker threads and the parse / transform
+runs off the event loop, so awaiting these never blocks the loop. They return
+exactly what the synchronous functions return:
+
+    data = await aget_ec2_spot_instances_prices(filter_region="us-east-1")
+"""
+import asyncio
+import functools
+
+try:
+    from . import ec2instancespricing as pricing
+except ImportError:
+    # running next to ec2instancespricing.py rather than as part of the package
+    import ec2instancespricing as pricing
+
+DEFAULT_MAX_CONCURRENCY = pricing.DEFAULT_MAX_CONCURRENCY
+SimpleResultsCache = pricing.SimpleResultsCache
+
+
+async def _aload_data(url, use_cache=False, cache_class=SimpleResultsCache):
+    # cache lookups run in the executor as well, FileResultsCache reads and parses a file
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(pricing._load_data, url, use_cache=use_cache, cache_class=cache_class))
+
+
+async def _aload_data_many(urls, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """ Load urls concurrently, at most max_concurrency at a time. Results keep the order of urls """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency or 1))
+
+    async def load(url):
+        async with semaphore:
+            return await _aload_data(url, use_cache=use_cache, cache_class=cache_class)
+
+    return await asyncio.gather(*[load(u) for u in urls])
+
+
+async def aget_ec2_instances_prices(urls, type, filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY, compact=False, snapshot=None):
+    if snapshot is not None:
+        # a memory mapped snapshot is read in the executor too, it has nothing to download
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(pricing.get_ec2_instances_prices, urls, type, filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, compact=compact, snapshot=snapshot))
+
+    urls = pricing._filter_urls_by_os_type(urls, type, filter_os_type)
+    payloads = await _aload_data_many(urls, use_cache, cache_class, max_concurrency)
+
+    def build():
+        regions = pricing._iter_payloads_regions(urls, payloads, type, filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type)
+        return pricing._build_instances_prices(regions, compact)
+
+    return await asyncio.get_running_loop().run_in_executor(None, build)
+
+
+async def aget_ec2_ondemand_instances_prices(filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY, compact=False, snapshot=None):
+    return await aget_ec2_instances_prices(pricing.INSTANCES_ON_DEMAND_URLS, "ondemand", filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class, max_concurrency, compact, snapshot)
+
+
+async def aget_ec2_reserved_instances_prices(filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY, compact=False, snapshot=None):
+    return await aget_ec2_instances_prices(pricing.INSTANCES_RESERVED_URLS, "reserved", filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class, max_concurrency, compact, snapshot)
+
+
+async def aget_ec2_spot_instances_prices(filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY, compact=False, snapshot=None):
+    return await aget_ec2_instances_prices(pricing.INSTANCES_SPOT_URLS, "spot", filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class, max_concurrency, compact, snapshot)
+
+
+async def aget_elb_instances_prices(filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY, compact=False, snapshot=None):
+    return await aget_ec2_instances_prices(pricing.INSTANCES_ELB_URLS, "elb", filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class, max_concurrency, compact, snapshot)
+
+
+async def aget_emr_instances_prices(filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY, compact=False, snapshot=None):
+    return await aget_ec2_instances_prices(pricing.INSTANCES_EMR_URLS, "emr", filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class, max_concurrency, compact, snapshot)
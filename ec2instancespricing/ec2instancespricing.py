@@ -28,18 +28,89 @@ try:
 except ImportError:
     import urllib2
 
+try:
+    import http.client as httplib
+    from urllib.parse import parse_qs, unquote, urljoin, urlparse
+except ImportError:
+    import httplib
+    from urllib import unquote
+    from urlparse import parse_qs, urljoin, urlparse
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+import atexit
+import base64
+import collections
+import contextlib
+import csv
 import datetime
+import getpass
+import hashlib
+import itertools
+import mmap
+import os
 import re
+import socket
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import time
+import warnings
+import zlib
 
 import tokenize
 import token
 import json
+import multiprocessing
 
 try:
     from StringIO import StringIO
 except ImportError:
     from io import StringIO
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory file locking on this platform (Windows)
+    fcntl = None
+
+# NumPy is only imported by _numpy, the first time fleet_cost needs it. None when it
+# isn't installed (fleet_cost falls back to plain Python lists), or set to None to use
+# the fallback anyway.
+numpy = False
+
+# os.replace is atomic on every platform but only exists on Python 3
+_atomic_rename = getattr(os, "replace", os.rename)
+
+# the umask can only be read by setting it, so do it once before any threads start
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+def _publish_file(tmp_path, path):
+    """ _atomic_rename a mkstemp file (created 0600) to path, readable by everyone the umask allows """
+    os.chmod(tmp_path, 0o644 & ~_umask)
+    _atomic_rename(tmp_path, path)
+
+try:
+    _intern = sys.intern
+except AttributeError:
+    # Python 2 can only intern byte strings
+    def _intern(s):
+        return intern(s) if isinstance(s, str) else s
+
 
 def fixup_js_literal_with_comments(in_text):
     """ Same as fixLazyJson but removing comments as well
@@ -97,6 +168,134 @@ def fixup_js_literal_with_comments(in_text):
 
     return tokenize.untokenize(result)
 
+
+_JS_LITERAL_TOKEN_RE = re.compile(r"""
+    (?P<dstring>"(?:[^"\\\n]|\\.)*")
+   |(?P<sstring>'(?:[^'\\\n]|\\.)*')
+   |(?P<scomment>//[^\n]*)
+   |(?P<mcomment>/\*.*?\*/)
+   |(?P<number>\d[\d.]*(?:[eE][+-]?\d+)?)
+   |(?P<name>[A-Za-z_$][\w$]*)
+   |(?P<comma>,(?=(?:\s|//[^\n]*|/\*.*?\*/)*[}\]]))
+""", re.DOTALL | re.VERBOSE)
+
+_JS_LITERAL_KEYWORDS = frozenset(['true', 'false', 'null', 'Infinity', 'NaN'])
+
+
+def _fixup_js_literal_token(m):
+    kind = m.lastgroup
+    if kind == "name":
+        tokval = m.group()
+        if tokval in _JS_LITERAL_KEYWORDS:
+            return tokval
+        return '"%s"' % tokval
+    elif kind == "sstring":
+        return '"%s"' % m.group()[1:-1].replace("\\'", "'").replace('"', '\\"')
+    elif kind == "dstring" or kind == "number":
+        return m.group()
+
+    # comments and trailing commas are dropped
+    return ''
+
+
+def fixup_js_literal(in_text):
+    """ Single pass replacement for fixup_js_literal_with_comments.
+        Quotes unquoted keys, converts single-quoted strings and removes comments and trailing commas.
+    """
+    return _JS_LITERAL_TOKEN_RE.sub(_fixup_js_literal_token, in_text)
+
+
+# Brackets (group 1 opens, group 2 closes), with strings and comments skipped over whole
+_JS_STRUCTURE_RE = re.compile(r"""
+    ([\[{])
+   |([\]}])
+   |"(?:[^"\\\n]|\\.)*"
+   |'(?:[^'\\\n]|\\.)*'
+   |//[^\n]*
+   |/\*.*?\*/
+""", re.DOTALL | re.VERBOSE)
+
+# An object whose first key is region / size, group 2 is its value
+_JS_REGION_OBJECT_RE = re.compile(r"""\{\s*(?:\bregion|"region"|'region')\s*:\s*(["'])([^"'\\\n]*)\1""")
+_JS_SIZE_OBJECT_RE = re.compile(r"""\{\s*(?:\bsize|"size"|'size')\s*:\s*(["'])([^"'\\\n]*)\1""")
+
+# what separates an object from the next one in the same array
+_JS_NEXT_ITEM_RE = re.compile(r"\}\s*,\s*$")
+
+
+def _js_object_end(text, start, end):
+    """ Position just after the object opening at text[start], or None if it isn't closed before end """
+    depth = 0
+    for m in _JS_STRUCTURE_RE.finditer(text, start, end):
+        kind = m.lastindex
+        if kind == 1:
+            depth += 1
+        elif kind == 2:
+            depth -= 1
+            if depth == 0:
+                return m.end()
+
+    return None
+
+
+def prune_js_literal(in_text, filter_region=None, keep_instance_type=None):
+    """ Drop the regions[] entries not named filter_region (a name, as spelled in the pricing file,
+        or a collection of them) and the sizes[] entries whose size keep_instance_type(size)
+        rejects, before the text is parsed.
+
+    Entries are found by their first key (as in all the pricing files), and the end of an
+    entry is only searched for bracket by bracket when the next entry is in another array,
+    so the dropped parts cost little more than a regular expression search. Returns None
+    if the text doesn't have the expected shape.
+    """
+    if filter_region is not None:
+        filter_regions = _filter_set(filter_region)
+        in_text = _prune_js_objects(in_text, _JS_REGION_OBJECT_RE, lambda name: name in filter_regions)
+
+    if in_text is not None and keep_instance_type is not None:
+        in_text = _prune_js_objects(in_text, _JS_SIZE_OBJECT_RE, keep_instance_type)
+
+    return in_text
+
+
+def _prune_js_objects(text, object_re, keep):
+    objects = list(object_re.finditer(text))
+    if not objects:
+        return text
+
+    parts = [text[:objects[0].start()]]
+    # the kept objects of the array being walked
+    kept = []
+    for i, m in enumerate(objects):
+        start = m.start()
+        next_start = objects[i + 1].start() if i + 1 < len(objects) else len(text)
+
+        separator = _JS_NEXT_ITEM_RE.search(text, start, next_start)
+        if separator is not None:
+            end = separator.start() + 1
+        else:
+            end = _js_object_end(text, start, next_start)
+            if end is None:
+                return None
+
+        if keep(m.group(2)):
+            kept.append(text[start:end])
+
+        if separator is None:
+            # the array ends (and maybe another one starts) before the next object
+            parts.append(",".join(kept))
+            parts.append(text[end:next_start])
+            kept = []
+
+    return "".join(parts)
+
+
+# The JS literal fixup used by _load_data. To go back to the tokenize based implementation use:
+#
+# ec2instancespricing.JS_LITERAL_FIXUP = ec2instancespricing.fixup_js_literal_with_comments
+#
+JS_LITERAL_FIXUP = fixup_js_literal
+
 OUTPUT_PRICE_TYPES = [
     "elb",
     "ondemand",
@@ -117,6 +316,34 @@ OUTPUT_FIELD_NAMES = [
     "upfront/perGB"
 ]
 
+PRICE_TYPES_BY_OUTPUT_TYPE = {
+    "elb": ["elb"],
+    "ondemand": ["ondemand"],
+    "reserved": ["reserved"],
+    "spot": ["spot"],
+    "spotordemand": ["ondemand", "spot"],
+    "emr": ["emr"],
+    "all": ["ondemand", "reserved", "spot", "elb", "emr"]
+}
+
+COMMANDS = [
+    "list",
+    "serve",
+    "snapshot",
+    "mirror",
+    "cost"
+]
+
+COST_GROUP_BY = [
+    "total",
+    "region",
+    "type",
+    "os",
+    "utilization",
+    "term",
+    "row"
+]
+
 OUTPUT_FORMATS = [
     "json",
     "table",
@@ -370,6 +597,56 @@ INSTANCES_USED_BY_EMR_URL = "http://a0.awsstatic.com/pricing/1/emr/pricing-emr.m
 
 INSTANCES_ELB_URL = "http://a0.awsstatic.com/pricing/1/ec2/pricing-elb.min.js"
 
+INSTANCES_ON_DEMAND_URLS = [
+    INSTANCES_ON_DEMAND_LINUX_URL,
+    INSTANCES_ON_DEMAND_RHEL_URL,
+    INSTANCES_ON_DEMAND_SLES_URL,
+    INSTANCES_ON_DEMAND_WINDOWS_URL,
+    INSTANCES_ON_DEMAND_WINSQL_URL,
+    INSTANCES_ON_DEMAND_WINSQLWEB_URL
+]
+
+INSTANCES_RESERVED_URLS = [
+    INSTANCES_RESERVED_LIGHT_UTILIZATION_LINUX_URL,
+    INSTANCES_RESERVED_LIGHT_UTILIZATION_RHEL_URL,
+    INSTANCES_RESERVED_LIGHT_UTILIZATION_SLES_URL,
+    INSTANCES_RESERVED_LIGHT_UTILIZATION_WINDOWS_URL,
+    INSTANCES_RESERVED_LIGHT_UTILIZATION_WINSQL_URL,
+    INSTANCES_RESERVED_LIGHT_UTILIZATION_WINSQLWEB_URL,
+    INSTANCES_RESERVED_MEDIUM_UTILIZATION_LINUX_URL,
+    INSTANCES_RESERVED_MEDIUM_UTILIZATION_RHEL_URL,
+    INSTANCES_RESERVED_MEDIUM_UTILIZATION_SLES_URL,
+    INSTANCES_RESERVED_MEDIUM_UTILIZATION_WINDOWS_URL,
+    INSTANCES_RESERVED_MEDIUM_UTILIZATION_WINSQL_URL,
+    INSTANCES_RESERVED_MEDIUM_UTILIZATION_WINSQLWEB_URL,
+    INSTANCES_RESERVED_HEAVY_UTILIZATION_LINUX_URL,
+    INSTANCES_RESERVED_HEAVY_UTILIZATION_RHEL_URL,
+    INSTANCES_RESERVED_HEAVY_UTILIZATION_SLES_URL,
+    INSTANCES_RESERVED_HEAVY_UTILIZATION_WINDOWS_URL,
+    INSTANCES_RESERVED_HEAVY_UTILIZATION_WINSQL_URL,
+    INSTANCES_RESERVED_HEAVY_UTILIZATION_WINSQLWEB_URL,
+]
+
+INSTANCES_SPOT_URLS = [
+    INSTANCES_SPOT_INSTANCE_URL
+]
+
+INSTANCES_ELB_URLS = [
+    INSTANCES_ELB_URL
+]
+
+INSTANCES_EMR_URLS = [
+    INSTANCES_USED_BY_EMR_URL
+]
+
+INSTANCES_URLS_BY_TYPE = {
+    "ondemand": INSTANCES_ON_DEMAND_URLS,
+    "reserved": INSTANCES_RESERVED_URLS,
+    "spot": INSTANCES_SPOT_URLS,
+    "elb": INSTANCES_ELB_URLS,
+    "emr": INSTANCES_EMR_URLS,
+}
+
 INSTANCES_ONDEMAND_OS_TYPE_BY_URL = {
     INSTANCES_ON_DEMAND_LINUX_URL: "linux",
     INSTANCES_ON_DEMAND_RHEL_URL: "rhel",
@@ -423,39 +700,76 @@ INSTANCES_RESERVED_UTILIZATION_TYPE_BY_URL = {
 
 DEFAULT_CURRENCY = "USD"
 
+# Maximum number of URLs fetched in parallel by get_ec2_instances_prices
+DEFAULT_MAX_CONCURRENCY = 8
+
+DEFAULT_HTTP_TIMEOUT = 60 # seconds
+
+# Parsed payloads remembered by content hash when refreshing a results cache, see _parse_data
+PARSE_MEMO_MAX_ENTRIES = 64
+PARSE_MEMO_MAX_BYTES = 64 * 1024 * 1024
+
+# Where pricing files are downloaded from, None for AWS itself. Either a base URL
+# (e.g. "http://mirror.internal/ec2pricing") or a directory written by mirror_sources.
+# Files are looked up as <base>/<host>/<path> of their original URL.
+PRICING_BASE_URL = None
+
+DEFAULT_MIRROR_DIRECTORY = "ec2instancespricing-mirror"
+
+# Number of worker processes that parse and transform the downloaded pricing files,
+# None to do it in the calling process. Only used when the results cache is not: cached
+# entries are parsed in the calling process, which keeps them.
+PARSE_PROCESSES = None
+
 
 class ResultsCacheBase(object):
     _instance = None
+    _instance_lock = threading.Lock()
 
     def __new__(cls, *args, **kwargs):
-        if not cls._instance:
-            cls._instance = super(ResultsCacheBase, cls).__new__(cls, *args, **kwargs)
+        # look at cls.__dict__ so a subclass never gets the instance of its parent
+        if cls.__dict__.get("_instance") is None:
+            with ResultsCacheBase._instance_lock:
+                if cls.__dict__.get("_instance") is None:
+                    cls._instance = super(ResultsCacheBase, cls).__new__(cls, *args, **kwargs)
 
         return cls._instance
 
     def get(self, key):
         pass
 
-    def set(self, key, value):
+    def peek(self, key):
+        """ Like get, for caches counting hits and misses without counting this lookup """
+        return self.get(key)
+
+    def set(self, key, value, validators=None):
         pass
 
+    def get_stale(self, key):
+        """ (value, validators) of an expired entry that can be revalidated, or None """
+        return None
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        """ Held by _load_data while a missing key is fetched and stored """
+        yield
+
 
 class SimpleResultsCache(ResultsCacheBase):
     _cache = {}
 
     def get(self, key):
-        if key in self._cache:
-            return self._cache[key]
+        return self._cache.get(key)
 
-        return None
-
-    def set(self, key, value):
+    def set(self, key, value, validators=None):
         self._cache[key] = value
 
 
 class TimeBasedResultsCache(ResultsCacheBase):
     _cache = {}
     _cache_expiration = {}
+    _cache_validators = {}
+    _lock = threading.Lock()
 
     # If you wish to chance this expiration use the following (a bit ugly) code:
     #
@@ -466,316 +780,2547 @@ class TimeBasedResultsCache(ResultsCacheBase):
     _default_expiration_in_seconds = 3600 # 1 hour
 
     def get(self, key):
-        if key not in self._cache or key not in self._cache_expiration:
-            return None
-
-        # If key has expired return None
-        if self._cache_expiration[key] < datetime.datetime.utcnow():
-            if key in self._cache: del self._cache[key]
-            if key in self._cache_expiration: del self._cache_expiration[key]
+        with self._lock:
+            if key not in self._cache or key not in self._cache_expiration:
+                return None
 
-            return None
+            # If key has expired return None. Expired entries with validators are kept
+            # around so they can be revalidated instead of downloaded again.
+            if self._cache_expiration[key] < datetime.datetime.utcnow():
+                if key not in self._cache_validators:
+                    del self._cache[key]
+                    del self._cache_expiration[key]
 
-        return self._cache[key]
+                return None
 
-    def set(self, key, value):
-        self._cache[key] = value
-        self._cache_expiration[key] = datetime.datetime.utcnow() + datetime.timedelta(seconds=self._default_expiration_in_seconds)
+            return self._cache[key]
 
+    def get_stale(self, key):
+        with self._lock:
+            if key not in self._cache or key not in self._cache_validators:
+                return None
 
-def _load_data(url, use_cache=False, cache_class=SimpleResultsCache):
-    cache_object = None
-    if use_cache:
-        cache_object = cache_class()
-        result = cache_object.get(url)
-        if result is not None:
-            return result
+            return self._cache[key], self._cache_validators[key]
 
-    f = urllib2.urlopen(url)
-    request = f.read()
+    def set(self, key, value, validators=None):
+        with self._lock:
+            self._cache[key] = value
+            self._cache_expiration[key] = datetime.datetime.utcnow() + datetime.timedelta(seconds=self._default_expiration_in_seconds)
+            if validators:
+                self._cache_validators[key] = validators
+            elif key in self._cache_validators:
+                del self._cache_validators[key]
 
-    if isinstance(request, bytes):
-        request = request.decode('utf8')
 
-    # strip initial comment (with newline)
-    modified_request = re.sub(re.compile(r'/\*.*\*/\n', re.DOTALL), '', request)
-    # strip from front of request
-    modified_request = re.sub(r'^callback\(', '', modified_request)
-    # strip from end of request
-    modified_request = re.sub(r'\);*$', '', modified_request)
+class StaleWhileRevalidateResultsCache(TimeBasedResultsCache):
+    """ Keeps serving an expired entry while it is refreshed on a background thread.
 
-    modified_request = fixup_js_literal_with_comments(modified_request)
-    obj = json.loads(modified_request)
+    An entry older than its expiration plus _max_staleness_in_seconds is no longer
+    served and the caller fetches it as usual. Failed background refreshes are
+    passed to on_refresh_error(key, exception) and the stale entry keeps being served:
 
-    # demjson is horribly slow
-    #obj = demjson.decode(modified_request)
+    StaleWhileRevalidateResultsCache()._max_staleness_in_seconds = 6 * 3600
+    StaleWhileRevalidateResultsCache().on_refresh_error = lambda key, e: log.warning("refresh of %s failed: %s", key, e)
+    """
+    _cache = {}
+    _cache_expiration = {}
+    _cache_validators = {}
+    _lock = threading.Lock()
+    _refreshing = set()
+    _refreshing_lock = threading.Lock()
 
-    if use_cache:
-        cache_object.set(url, obj)
+    _max_staleness_in_seconds = 86400 # 1 day
+    on_refresh_error = None
 
-    return obj
+    def get(self, key):
+        with self._lock:
+            if key not in self._cache or key not in self._cache_expiration:
+                return None
 
+            now = datetime.datetime.utcnow()
+            value = self._cache[key]
+            expiration = self._cache_expiration[key]
 
-def get_ec2_instances_prices(urls, type, filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache):
-    get_specific_region = (filter_region is not None)
+        if expiration >= now:
+            return value
 
-    # spot instance JSON not using the real region names
-    if type == "spot" and get_specific_region:
-        filter_region = EC2_REGIONS_API_TO_JSON_NAME[filter_region]
+        if expiration + datetime.timedelta(seconds=self._max_staleness_in_seconds) < now:
+            # too stale to serve, the caller refreshes it in the foreground
+            return None
 
-    # except for us-east-1, reserved instance JSON uses the real region names
-    if type == "reserved" and get_specific_region and filter_region == 'us-east-1':
-        filter_region = EC2_REGIONS_API_TO_JSON_NAME[filter_region]
+        self._refresh_in_background(key)
+        return value
 
-    get_specific_instance_type = (filter_instance_type is not None)
-    get_specific_os_type = (filter_os_type is not None)
-    get_specific_instance_type_pattern = (filter_instance_type_pattern is not None)
+    def get_stale(self, key):
+        # entries without validators are downloaded again by _refresh_cache_entry
+        return super(StaleWhileRevalidateResultsCache, self).get_stale(key)
 
-    currency = DEFAULT_CURRENCY
+    def _refresh_in_background(self, key):
+        with self._refreshing_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
 
-    result_regions = []
-    result = {
-        "config": {
-            "currency": currency,
-            "unit": "perhr"
-        },
-        "regions": result_regions
-    }
+        t = threading.Thread(target=self._refresh, args=(key,))
+        t.daemon = True
+        t.start()
 
-    os_type = None
-    os_type_by_url = ["ondemand", "reserved"]
-    utilization_type = type
+    def _refresh(self, key):
+        try:
+            _refresh_cache_entry(self, key, check_cache=False)
+        except Exception as e:
+            if self.on_refresh_error is not None:
+                self.on_refresh_error(key, e)
+        finally:
+            with self._refreshing_lock:
+                self._refreshing.discard(key)
 
-    for u in urls:
-        if type == "ondemand":
-            os_type = INSTANCES_ONDEMAND_OS_TYPE_BY_URL[u]
-        elif type == "reserved":
-            utilization_type = INSTANCES_RESERVED_UTILIZATION_TYPE_BY_URL[u]
-            os_type = INSTANCES_RESERVED_OS_TYPE_BY_URL[u]
 
-        if (type in os_type_by_url) and get_specific_os_type and os_type != filter_os_type:
-           continue
+def _approximate_size(obj):
+    """ Approximate number of bytes used by a parsed payload (containers and their contents) """
+    size = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        size += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple)):
+            stack.extend(o)
 
-        data = _load_data(u, use_cache=use_cache, cache_class=cache_class)
-        if not("config" in data and data["config"] and "regions" in data["config"] and data["config"]["regions"]): continue
+    return size
 
-        for r in data["config"]["regions"]:
-            if "region" not in r or not r["region"]: continue
 
-            if get_specific_region and filter_region != r["region"]:
-                continue
+class LRUResultsCache(ResultsCacheBase):
+    """ Bounded cache evicting the least recently used payloads.
 
-            region_name = JSON_NAME_TO_EC2_REGIONS_API[r["region"]]
-            instance_types = []
+    Limits are the number of entries and the approximate size of the cached
+    payloads in bytes (None for no limit). Entries can also expire. Storage
+    belongs to the instance, so subclasses are separate caches:
 
-            types = r["instanceTypes"] if "instanceTypes" in r else r["types"] if "types" in r else None
-            if types is None: continue
+    class SpotCache(LRUResultsCache):
+        _max_entries = 4
+        _max_bytes = 64 * 1024 * 1024
 
-            for it in types:
-                if "sizes" in it:
-                    for s in it["sizes"]:
-                        instance_size = s["size"]
+    or use the same (a bit ugly) way as TimeBasedResultsCache:
 
-                        _type = instance_size
-                        if _type == "cc1.8xlarge":
-                            # Fix conflict where cc1 and cc2 share the same type
-                            _type = "cc2.8xlarge"
+    LRUResultsCache()._max_bytes = 256 * 1024 * 1024
 
-                        # Clean the "*" the appears in the r3 instance
-                        if _type.find("*") > -1:
-                            _type = _type.replace("*", "").strip()
+    stats() reports hits, misses, expirations and evictions.
+    """
+    _max_entries = 64
+    _max_bytes = None
+    _default_expiration_in_seconds = None # never expire
 
-                        if get_specific_instance_type and _type != filter_instance_type:
-                            continue
+    def __new__(cls, *args, **kwargs):
+        instance = super(LRUResultsCache, cls).__new__(cls, *args, **kwargs)
+        if "_entries" not in instance.__dict__:
+            instance._entries = collections.OrderedDict()
+            instance._bytes = 0
+            instance._stats = {"hits": 0, "misses": 0, "expirations": 0, "evictions": 0}
+            instance._lock = threading.Lock()
 
-                        if get_specific_instance_type_pattern:
-                            type_pattern_re = re.compile(EC2_INSTANCE_TYPES_PATTERN[filter_instance_type_pattern])
-                            if type_pattern_re.match(_type) is None:
-                                continue
+        return instance
 
-                        if type == "emr":
-                            for price_data in s["valueColumns"]:
-                                if price_data[u'name'] != 'emr':
-                                    continue
-                                price = None
-                                try:
-                                    if price_data["prices"][currency]:
-                                        price = float(price_data["prices"][currency])
-                                except ValueError:
-                                    price = None
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+
+            value, expires, validators, size = entry
+            if expires is not None and expires < time.time():
+                self._stats["misses"] += 1
+                self._stats["expirations"] += 1
+                if validators:
+                    # keep it (as least recently used) so it can be revalidated
+                    self._entries[key] = entry
+                    self._demote(key)
+                else:
+                    self._bytes -= size
+                return None
+
+            # re-insert as most recently used
+            self._entries[key] = entry
+            self._stats["hits"] += 1
+            return value
+
+    def peek(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[1] is not None and entry[1] < time.time()):
+                return None
+
+            return entry[0]
+
+    def _demote(self, key):
+        """ Make key the next entry to be evicted """
+        if hasattr(self._entries, "move_to_end"):
+            self._entries.move_to_end(key, last=False)
+
+    def get_stale(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not entry[2]:
+                return None
+
+            return entry[0], entry[2]
+
+    def set(self, key, value, validators=None):
+        size = _approximate_size(value)
+        expires = None
+        if self._default_expiration_in_seconds is not None:
+            expires = time.time() + self._default_expiration_in_seconds
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[3]
+
+            self._entries[key] = (value, expires, validators, size)
+            self._bytes += size
+            self._evict()
+
+    def _evict(self):
+        # never evict the entry that was just added
+        while len(self._entries) > 1:
+            over_entries = self._max_entries is not None and len(self._entries) > self._max_entries
+            over_bytes = self._max_bytes is not None and self._bytes > self._max_bytes
+            if not (over_entries or over_bytes):
+                break
+
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry[3]
+            self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+
+        return stats
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FileResultsCache(ResultsCacheBase):
+    """ Stores parsed payloads on disk so they are shared between processes.
+
+    Entries are written atomically (temp file + rename) and a missing key is
+    fetched under an exclusive file lock, so concurrent invocations on the same
+    host wait for a single download instead of each fetching the URL.
+
+    The default directory is per user. A directory that isn't owned by the current user,
+    or that others can write to, isn't trusted and nothing is cached, as when it can't
+    be written to. To change the location or expiration use:
+
+    FileResultsCache()._cache_directory = "/var/cache/ec2instancespricing"
+    FileResultsCache()._default_expiration_in_seconds = 86400 # 1 day
+    """
+    _cache_directory = os.path.join(tempfile.gettempdir(), "ec2instancespricing-%s" % (os.getuid() if hasattr(os, "getuid") else getpass.getuser()))
+    _default_expiration_in_seconds = 3600 # 1 hour
 
-                                instance_types.append({
-                                        "type": _type,
-                                        "os": 'emr',
-                                        "price": price,
-                                        "prices": {
-                                            type: {
-                                                "hourly": price,
-                                                "upfront_perGB": none_as_string(0)
-                                            }
-                                        },
-                                        "utilization": type
-                                })
-                        if type == "reserved":
-                            prices = {
-                                "1year": {
-                                    "hourly": None,
-                                    "upfront_perGB": None
-                                },
-                                "3year": {
-                                    "hourly": None,
-                                    "upfront_perGB": None
-                                }
-                            }
-                            instance_types.append({
-                                "type": _type,
-                                "os": os_type,
-                                "utilization": utilization_type,
-                                "prices": prices
-                            })
+    def _directory(self):
+        """ The cache directory, created if needed, or None when it can't be trusted """
+        try:
+            os.makedirs(self._cache_directory, 0o700)
+        except OSError:
+            # already there, created by another process in the meantime or not creatable
+            pass
 
-                        for price_data in s["valueColumns"]:
-                            price = None
-                            try:
-                                if price_data["prices"][currency]:
-                                    price = float(price_data["prices"][currency])
-                            except ValueError:
-                                price = None
+        try:
+            st = os.lstat(self._cache_directory)
+        except OSError:
+            return None
 
-                            if type == "reserved":
-                                if price_data["name"] == "yrTerm1":
-                                    prices["1year"]["upfront_perGB"] = price
-                                elif price_data["name"] == "yrTerm1Hourly":
-                                    prices["1year"]["hourly"] = price
-                                elif price_data["name"] == "yrTerm3":
-                                    prices["3year"]["upfront_perGB"] = price
-                                elif price_data["name"] == "yrTerm3Hourly":
-                                    prices["3year"]["hourly"] = price
-                            else:
-                                if type != "spot" and price_data["name"] == "os":
-                                    price_data["name"] = "test"
+        if not stat.S_ISDIR(st.st_mode):
+            return None
+        if hasattr(os, "getuid") and (st.st_uid != os.getuid() or st.st_mode & 0o022):
+            return None
 
-                                if get_specific_os_type and price_data["name"] != filter_os_type:
-                                    continue
+        return self._cache_directory
 
-                                instance_types.append({
-                                    "type": _type,
-                                    "os": price_data["name"],
-                                    "price": price,
-                                    "prices": {
-                                        type: {
-                                            "hourly": price,
-                                            "upfront_perGB": none_as_string(0)
-                                        }
-                                    },
-                                    "utilization": type
-                                })
-                elif "values" in it:
-                    assert len(it["values"]) == 2
+    def _path(self, key):
+        directory = self._directory()
+        if directory is None:
+            return None
 
-                    perELBHour = it["values"][0]
-                    GBProcessed = it["values"][1]
-                    assert perELBHour["rate"] == "perELBHour"
-                    assert GBProcessed["rate"] == "perGBProcessed"
+        return os.path.join(directory, hashlib.sha1(key.encode('utf8')).hexdigest())
 
-                    instance_types.append({
-                        "type": 'elb',
-                        "os": 'elb',
-                        "price": float(perELBHour["prices"][currency]),
-                        "prices": {
-                            "perGBProcessed": {
-                                "hourly": float(perELBHour["prices"][currency]),
-                                "upfront_perGB": float(GBProcessed["prices"][currency])
-                            }
-                        },
-                        "utilization": 'elb',
-                    })
+    def _read(self, key):
+        path = self._path(key)
+        if path is None:
+            return None
 
-            result_regions.append({
-                "region": JSON_NAME_TO_EC2_REGIONS_API[region_name],
-                "instanceTypes": instance_types
-            })
+        try:
+            with open(path + ".json", "r") as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
 
-    return result
+        if not isinstance(entry, dict) or entry.get("key") != key or "value" not in entry:
+            return None
 
+        return entry
 
-def get_emr_instances_prices(filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache):
-    urls = [
-        INSTANCES_USED_BY_EMR_URL
-    ]
-    result = get_ec2_instances_prices(urls, "emr", filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class)
+    def get(self, key):
+        entry = self._read(key)
+        if entry is None or entry.get("expires", 0) < time.time():
+            return None
 
-    return result
+        return entry["value"]
 
-def get_ec2_reserved_instances_prices(filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache):
-    """ Get EC2 reserved instances prices. Results can be filtered by region """
+    def get_stale(self, key):
+        entry = self._read(key)
+        if entry is None or not isinstance(entry.get("validators"), dict) or not entry["validators"]:
+            return None
 
-    urls = [
-        INSTANCES_RESERVED_LIGHT_UTILIZATION_LINUX_URL,
-        INSTANCES_RESERVED_LIGHT_UTILIZATION_RHEL_URL,
-        INSTANCES_RESERVED_LIGHT_UTILIZATION_SLES_URL,
-        INSTANCES_RESERVED_LIGHT_UTILIZATION_WINDOWS_URL,
-        INSTANCES_RESERVED_LIGHT_UTILIZATION_WINSQL_URL,
-        INSTANCES_RESERVED_LIGHT_UTILIZATION_WINSQLWEB_URL,
-        INSTANCES_RESERVED_MEDIUM_UTILIZATION_LINUX_URL,
-        INSTANCES_RESERVED_MEDIUM_UTILIZATION_RHEL_URL,
-        INSTANCES_RESERVED_MEDIUM_UTILIZATION_SLES_URL,
-        INSTANCES_RESERVED_MEDIUM_UTILIZATION_WINDOWS_URL,
-        INSTANCES_RESERVED_MEDIUM_UTILIZATION_WINSQL_URL,
-        INSTANCES_RESERVED_MEDIUM_UTILIZATION_WINSQLWEB_URL,
-        INSTANCES_RESERVED_HEAVY_UTILIZATION_LINUX_URL,
-        INSTANCES_RESERVED_HEAVY_UTILIZATION_RHEL_URL,
-        INSTANCES_RESERVED_HEAVY_UTILIZATION_SLES_URL,
-        INSTANCES_RESERVED_HEAVY_UTILIZATION_WINDOWS_URL,
-        INSTANCES_RESERVED_HEAVY_UTILIZATION_WINSQL_URL,
-        INSTANCES_RESERVED_HEAVY_UTILIZATION_WINSQLWEB_URL,
-    ]
+        return entry["value"], entry["validators"]
 
-    result = get_ec2_instances_prices(urls, "reserved", filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class)
+    def set(self, key, value, validators=None):
+        path = self._path(key)
+        if path is None:
+            return
 
-    return result
+        entry = {
+            "key": key,
+            "expires": time.time() + self._default_expiration_in_seconds,
+            "validators": validators,
+            "value": value
+        }
 
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        except (IOError, OSError):
+            # not writable, the value just isn't cached
+            return
 
-def get_ec2_ondemand_instances_prices(filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache):
-    """ Get EC2 on-demand instances prices. Results can be filtered by region """
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f)
+            _atomic_rename(tmp_path, path + ".json")
+        except (IOError, OSError):
+            # e.g. a full disk, the value just isn't cached
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        path = self._path(key)
+        f = None
+        if fcntl is not None and path is not None:
+            try:
+                f = open(path + ".lock", "a")
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            except (IOError, OSError):
+                # fetched without the lock, like on platforms without fcntl
+                if f is not None:
+                    f.close()
+                f = None
+
+        if f is None:
+            yield
+            return
 
-    urls = [
-        INSTANCES_ON_DEMAND_LINUX_URL,
-        INSTANCES_ON_DEMAND_RHEL_URL,
-        INSTANCES_ON_DEMAND_SLES_URL,
-        INSTANCES_ON_DEMAND_WINDOWS_URL,
-        INSTANCES_ON_DEMAND_WINSQL_URL,
-        INSTANCES_ON_DEMAND_WINSQLWEB_URL
-    ]
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            f.close()
 
-    result = get_ec2_instances_prices(urls, "ondemand", filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class)
 
-    return result
+class HTTPConnectionPool(object):
+    """ Keeps idle keep-alive connections per host and asks for gzip encoded responses.
 
+    Every pricing file lives on one of a couple of hosts, so reusing connections
+    saves a TCP (and TLS) handshake per file. Per-host counters are available
+    through stats(). Like urlopen, it goes through the http_proxy / https_proxy
+    of the environment (https through a CONNECT tunnel) unless no_proxy says not to.
+    """
+    _chunk_size = 64 * 1024
+    _max_redirects = 5
+
+    def __init__(self, max_idle_per_host=DEFAULT_MAX_CONCURRENCY, timeout=DEFAULT_HTTP_TIMEOUT):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self._idle = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _host_stats(self, host):
+        if host not in self._stats:
+            self._stats[host] = {
+                "requests": 0,
+                "connections_opened": 0,
+                "connections_reused": 0,
+                "bytes_received": 0,
+                "bytes_decoded": 0
+            }
+        return self._stats[host]
+
+    @staticmethod
+    def _proxy(scheme, host):
+        """ (proxy host, its Proxy-Authorization header or None) for scheme://host, None to connect directly """
+        proxy = urllib2.getproxies().get(scheme)
+        if not proxy or urllib2.proxy_bypass(host):
+            return None
 
-def get_ec2_spot_instances_prices(filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache):
+        if "://" not in proxy:
+            proxy = "http://" + proxy
+        parsed = urlparse(proxy)
+
+        authorization = None
+        if parsed.username is not None:
+            credentials = "%s:%s" % (unquote(parsed.username), unquote(parsed.password or ""))
+            authorization = "Basic " + base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+
+        return parsed.hostname + (":%d" % parsed.port if parsed.port else ""), authorization
+
+    def _checkout(self, scheme, host, proxy):
+        with self._lock:
+            stats = self._host_stats(host)
+            idle = self._idle.get((scheme, host, proxy))
+            if idle:
+                stats["connections_reused"] += 1
+                return idle.pop(), True
+
+            stats["connections_opened"] += 1
+
+        if proxy is not None:
+            proxy_host, authorization = proxy
+            if scheme == "https":
+                conn = httplib.HTTPSConnection(proxy_host, timeout=self.timeout)
+                conn.set_tunnel(host, headers={"Proxy-Authorization": authorization} if authorization else None)
+                return conn, False
+            return httplib.HTTPConnection(proxy_host, timeout=self.timeout), False
+
+        if scheme == "https":
+            return httplib.HTTPSConnection(host, timeout=self.timeout), False
+        return httplib.HTTPConnection(host, timeout=self.timeout), False
+
+    def _checkin(self, scheme, host, proxy, conn):
+        with self._lock:
+            idle = self._idle.setdefault((scheme, host, proxy), [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+
+        conn.close()
+
+    def _read_body(self, response, host):
+        decompressor = None
+        if response.getheader("content-encoding", "").lower() == "gzip":
+            # 16 + MAX_WBITS expects a gzip header and trailer
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        chunks = []
+        received = 0
+        while True:
+            chunk = response.read(self._chunk_size)
+            if not chunk:
+                break
+
+            received += len(chunk)
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            chunks.append(chunk)
+
+        if decompressor is not None:
+            chunks.append(decompressor.flush())
+
+        body = b"".join(chunks)
+        with self._lock:
+            stats = self._host_stats(host)
+            stats["bytes_received"] += received
+            stats["bytes_decoded"] += len(body)
+
+        return body
+
+    def _request_once(self, url, headers):
+        parsed = urlparse(url)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+
+        request_headers = {"Accept-Encoding": "gzip"}
+        request_headers.update(headers or {})
+
+        proxy = self._proxy(parsed.scheme, parsed.netloc)
+        if proxy is not None and parsed.scheme == "http":
+            # a plain HTTP proxy takes the whole URL
+            path = url
+            if proxy[1]:
+                request_headers["Proxy-Authorization"] = proxy[1]
+
+        with self._lock:
+            self._host_stats(parsed.netloc)["requests"] += 1
+
+        conn, reused = self._checkout(parsed.scheme, parsed.netloc, proxy)
+        try:
+            try:
+                conn.request("GET", path, headers=request_headers)
+                response = conn.getresponse()
+            except (httplib.HTTPException, socket.error):
+                if not reused:
+                    raise
+
+                # the server closed an idle keep-alive connection, retry on a fresh one
+                conn.close()
+                conn, reused = self._checkout(parsed.scheme, parsed.netloc, proxy)
+                conn.request("GET", path, headers=request_headers)
+                response = conn.getresponse()
+
+            body = self._read_body(response, parsed.netloc)
+        except:
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._checkin(parsed.scheme, parsed.netloc, proxy, conn)
+
+        return response.status, response.reason, dict((k.lower(), v) for k, v in response.getheaders()), body
+
+    def request(self, url, headers=None):
+        """ GET url following redirects. Returns (status, headers, body) with lower-cased header names """
+        for _ in range(self._max_redirects + 1):
+            status, reason, response_headers, body = self._request_once(url, headers)
+            if status in (301, 302, 303, 307, 308) and "location" in response_headers:
+                url = urljoin(url, response_headers["location"])
+                continue
+
+            if status >= 400:
+                raise urllib2.HTTPError(url, status, reason, response_headers, None)
+
+            return status, response_headers, body
+
+        raise urllib2.HTTPError(url, status, "Too many redirects", response_headers, None)
+
+    def stats(self):
+        """ Per-host request, connection and byte counters """
+        with self._lock:
+            return dict((host, dict(stats)) for host, stats in self._stats.items())
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+
+_http_pool = HTTPConnectionPool()
+
+
+def get_http_connection_stats():
+    """ Per-host connection statistics of the HTTP client used by _load_data """
+    return _http_pool.stats()
+
+
+class _SingleFlight(object):
+    """ Runs a function once per key at a time. Callers arriving while it runs wait for
+        and share its result (or exception) instead of running it again.
+    """
+
+    class _Call(object):
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+
+_in_flight = _SingleFlight()
+
+
+class Instrumentation(object):
+    """ Collects the duration and byte count of each loading stage (download, strip,
+        fixup, json, transform) and cache / parse memo counters.
+
+    Enable it with INSTRUMENTATION = Instrumentation(). Any object with the same
+    timing() and incr() methods can be used instead, e.g. to forward to a metrics system.
+    """
+
+    def __init__(self):
+        self._timings = collections.OrderedDict()
+        self._counters = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def timing(self, stage, seconds, nbytes=0):
+        with self._lock:
+            timing = self._timings.get(stage)
+            if timing is None:
+                timing = self._timings[stage] = {"count": 0, "seconds": 0.0, "bytes": 0}
+            timing["count"] += 1
+            timing["seconds"] += seconds
+            timing["bytes"] += nbytes
+
+    def incr(self, counter, n=1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + n
+
+    def stats(self):
+        with self._lock:
+            return {
+                "timings": collections.OrderedDict((k, dict(v)) for k, v in self._timings.items()),
+                "counters": collections.OrderedDict(self._counters)
+            }
+
+    def report(self, out=None):
+        """ Print the stats as a small table (to stderr by default) """
+        out = out or sys.stderr
+        stats = self.stats()
+        for stage, timing in stats["timings"].items():
+            out.write("%-12s %6d calls %10.4fs %12d bytes\n" % (stage, timing["count"], timing["seconds"], timing["bytes"]))
+        for counter, n in stats["counters"].items():
+            out.write("%-24s %6d\n" % (counter, n))
+
+
+# None disables instrumentation, so the hooks below cost a global lookup
+INSTRUMENTATION = None
+
+
+def _timed(stage, fn, arg):
+    """ fn(arg), recorded as stage with the size of arg """
+    instrumentation = INSTRUMENTATION
+    if instrumentation is None:
+        return fn(arg)
+
+    start = time.time()
+    result = fn(arg)
+    instrumentation.timing(stage, time.time() - start, len(arg))
+    return result
+
+
+def _timed_iter(stage, iterable):
+    """ Yield from iterable, recording the time spent producing the items as stage """
+    instrumentation = INSTRUMENTATION
+    iterator = iter(iterable)
+    seconds = 0.0
+    try:
+        while True:
+            start = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                seconds += time.time() - start
+            yield item
+    finally:
+        # INSTRUMENTATION is read on the first item, the hooks may be gone by then
+        if instrumentation is not None:
+            instrumentation.timing(stage, seconds)
+
+
+def _count(counter):
+    instrumentation = INSTRUMENTATION
+    if instrumentation is not None:
+        instrumentation.incr(counter)
+
+
+def _load_data(url, use_cache=False, cache_class=SimpleResultsCache):
+    # concurrent misses on the same url share one download
+    if not use_cache:
+        # but each caller parses its own copy, the transforms modify the payloads they're given
+        body, _ = _in_flight.do((None, url), _download, url)
+        return _parse_data(body)
+
+    cache_object = cache_class()
+    result = cache_object.get(url)
+    if result is not None:
+        _count("cache.hit")
+        return result
+
+    _count("cache.miss")
+    return _in_flight.do((cache_class, url), _refresh_cache_entry, cache_object, url)
+
+
+def _refresh_cache_entry(cache_object, url, check_cache=True):
+    """ Download (or revalidate) url, parse it and store it in cache_object """
+    with cache_object.lock(url):
+        # another process (or thread) may have stored it while we waited
+        if check_cache:
+            result = cache_object.peek(url)
+            if result is not None:
+                return result
+
+        stale = cache_object.get_stale(url)
+        if stale is not None:
+            _count("cache.expired")
+            result, validators = stale
+            body, validators = _download(url, validators)
+            if body is None:
+                # 304 Not Modified, keep the parsed value and restart its TTL
+                cache_object.set(url, result, validators)
+                return result
+        else:
+            body, validators = _download(url)
+
+        result = _parse_data(body, memo=True)
+        cache_object.set(url, result, validators)
+
+    return result
+
+
+def _download(url, validators=None):
+    """ Download url, revalidating with validators (ETag / Last-Modified) if given.
+        Returns (body, validators). body is None when the server answered 304 Not Modified.
+    """
+    instrumentation = INSTRUMENTATION
+    if instrumentation is None:
+        return _request(url, validators)
+
+    start = time.time()
+    body, validators = _request(url, validators)
+    instrumentation.timing("download", time.time() - start, len(body) if body is not None else 0)
+    if body is None:
+        instrumentation.incr("download.not_modified")
+
+    return body, validators
+
+
+def _request(url, validators=None):
+    url = resolve_url(url)
+    if urlparse(url).scheme not in ("http", "https"):
+        # e.g. a file:// mirror, with the same timeout as the connection pool
+        with contextlib.closing(urllib2.urlopen(url, timeout=_http_pool.timeout)) as response:
+            return response.read(), None
+
+    headers = {}
+    if validators:
+        if "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if "last-modified" in validators:
+            headers["If-Modified-Since"] = validators["last-modified"]
+
+    status, response_headers, body = _http_pool.request(url, headers)
+    if status == 304:
+        return None, validators
+
+    validators = dict((k, response_headers[k]) for k in ("etag", "last-modified") if k in response_headers)
+    return body, validators or None
+
+
+def mirror_path(url):
+    """ Path of url inside a mirror (its host followed by its path) """
+    parsed = urlparse(url)
+    return parsed.netloc + parsed.path
+
+
+def resolve_url(url):
+    """ The URL url is actually downloaded from, according to PRICING_BASE_URL """
+    base = PRICING_BASE_URL
+    if base is None:
+        return url
+
+    if "://" not in base:
+        base = "file://" + os.path.abspath(base)
+
+    return base.rstrip("/") + "/" + mirror_path(url)
+
+
+def mirror_sources(directory=DEFAULT_MIRROR_DIRECTORY, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """ Download every pricing file once into directory, which can then be used as PRICING_BASE_URL.
+        Returns the paths of the written files.
+    """
+    urls = [u for type in ("ondemand", "reserved", "spot", "elb", "emr") for u in INSTANCES_URLS_BY_TYPE[type]]
+
+    def mirror(url):
+        body, _ = _download(url)
+        path = os.path.join(directory, *mirror_path(url).split("/"))
+
+        parent = os.path.dirname(path)
+        if not os.path.isdir(parent):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                # created by another worker in the meantime
+                if not os.path.isdir(parent):
+                    raise
+
+        fd, tmp_path = tempfile.mkstemp(dir=parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(body)
+            # served by a web server or read by other users, unlike mkstemp's 0600
+            _publish_file(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+        return path
+
+    return _run_concurrently(mirror, urls, max_concurrency)
+
+
+_parse_memo = collections.OrderedDict()
+_parse_memo_bytes = 0
+_parse_memo_lock = threading.Lock()
+
+
+def _clear_parse_memo():
+    global _parse_memo_bytes
+
+    with _parse_memo_lock:
+        _parse_memo.clear()
+        _parse_memo_bytes = 0
+
+
+def _parse_data(request, memo=False):
+    """ Parse a downloaded payload. With memo=True, bodies identical to a recently
+        parsed one (by SHA-1) return the previously parsed object without parsing
+        again, so it must not be modified: only cached results, which are shared
+        anyway, go through the memo.
+    """
+    global _parse_memo_bytes
+
+    if not isinstance(request, bytes):
+        request = request.encode('utf8')
+
+    if not memo:
+        return _parse_payload(request)
+
+    digest = hashlib.sha1(request).digest()
+    with _parse_memo_lock:
+        entry = _parse_memo.pop(digest, None)
+        if entry is not None:
+            # re-insert as most recently used
+            _parse_memo[digest] = entry
+            _count("parse_memo.hit")
+            return entry[0]
+
+    _count("parse_memo.miss")
+    obj = _parse_payload(request)
+    size = _approximate_size(obj)
+
+    with _parse_memo_lock:
+        if digest not in _parse_memo and size <= PARSE_MEMO_MAX_BYTES:
+            _parse_memo[digest] = (obj, size)
+            _parse_memo_bytes += size
+        while _parse_memo and (len(_parse_memo) > PARSE_MEMO_MAX_ENTRIES or _parse_memo_bytes > PARSE_MEMO_MAX_BYTES):
+            _parse_memo_bytes -= _parse_memo.popitem(last=False)[1][1]
+
+    return obj
+
+
+def _parse_payload(request, filter_region=None, keep_instance_type=None):
+    """ Parse a downloaded payload. With filter_region (as spelled in the payload) or
+        keep_instance_type the regions and sizes they rule out are dropped before parsing,
+        see prune_js_literal.
+    """
+    modified_request = _timed("strip", _strip_payload, request)
+
+    if filter_region is not None or keep_instance_type is not None:
+        pruned = _timed("prune", lambda text: prune_js_literal(text, filter_region, keep_instance_type), modified_request)
+        if pruned is not None:
+            try:
+                return _parse_js_literal(pruned)
+            except ValueError:
+                # not shaped like prune_js_literal expects, parse all of it
+                pass
+
+    return _parse_js_literal(modified_request)
+
+
+def _parse_js_literal(modified_request):
+    modified_request = _timed("fixup", JS_LITERAL_FIXUP, modified_request)
+    obj = _timed("json", json.loads, modified_request)
+
+    # demjson is horribly slow
+    #obj = demjson.decode(modified_request)
+
+    return obj
+
+
+def _strip_payload(request):
+    """ Decode a downloaded payload and strip its comment header and callback(...) wrapper """
+    if isinstance(request, bytes):
+        request = request.decode('utf8')
+
+    # strip initial comment (with newline)
+    modified_request = re.sub(re.compile(r'/\*.*\*/\n', re.DOTALL), '', request)
+    # strip from front of request
+    modified_request = re.sub(r'^callback\(', '', modified_request)
+    # strip from end of request
+    modified_request = re.sub(r'\);*$', '', modified_request)
+
+    return modified_request
+
+
+def _load_data_many(urls, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """ Load several URLs using a bounded pool of worker threads.
+        Results are returned in the same order as urls.
+    """
+    return _run_concurrently(lambda u: _load_data(u, use_cache=use_cache, cache_class=cache_class), urls, max_concurrency)
+
+
+def _run_concurrently(fn, items, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """ [fn(item) for item in items] using at most max_concurrency worker threads """
+    if not max_concurrency or max_concurrency <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+
+    results = [None] * len(items)
+    errors = []
+    pending = queue.Queue()
+    for i, item in enumerate(items):
+        pending.put((i, item))
+
+    def worker():
+        while True:
+            try:
+                i, item = pending.get_nowait()
+            except queue.Empty:
+                return
+
+            try:
+                results[i] = fn(item)
+            except Exception as e:
+                errors.append((i, e))
+
+    threads = [threading.Thread(target=worker) for _ in range(min(max_concurrency, len(items)))]
+    for t in threads:
+        t.daemon = True
+        t.start()
+
+    for t in threads:
+        t.join()
+
+    # re-raise the error of the first failing item so failures stay deterministic
+    if errors:
+        errors.sort(key=lambda e: e[0])
+        raise errors[0][1]
+
+    return results
+
+
+_MISSING = object()
+
+
+class InstanceTypePrice(object):
+    """ Compact, read-only replacement for the per instance type dicts in get_*_prices results.
+
+    Strings are interned and the per-term prices are kept in one flat tuple, but the
+    object can still be used like the dict it replaces (it["type"], it["prices"][term]["hourly"],
+    "price" in it, it.items() ...). Use to_dict() to get the plain dict back (e.g. for json.dumps).
+    """
+    __slots__ = ("type", "os", "utilization", "price", "_prices")
+
+    def __init__(self, type, os, utilization, prices, price=_MISSING):
+        self.type = _intern(type)
+        self.os = _intern(os)
+        self.utilization = _intern(utilization)
+        self.price = price
+
+        flat = []
+        for term, term_prices in prices.items():
+            flat.extend((_intern(term), term_prices["hourly"], term_prices["upfront_perGB"]))
+        self._prices = tuple(flat)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["type"], d["os"], d["utilization"], d["prices"], d.get("price", _MISSING))
+
+    @property
+    def prices(self):
+        p = self._prices
+        return dict((p[i], {"hourly": p[i + 1], "upfront_perGB": p[i + 2]}) for i in range(0, len(p), 3))
+
+    def keys(self):
+        if self.price is _MISSING:
+            return ["type", "os", "utilization", "prices"]
+        return ["type", "os", "price", "prices", "utilization"]
+
+    def __getitem__(self, key):
+        if key not in self.keys():
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (dict, InstanceTypePrice)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "InstanceTypePrice(%r)" % self.to_dict()
+
+
+def get_ec2_instances_prices(urls, type, filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY, compact=False, snapshot=None):
+    """ Get the prices in urls. With compact=True instance types are returned as
+        InstanceTypePrice objects instead of dicts, which takes a fraction of the memory.
+        snapshot (a path or a PriceSnapshot) reads the prices from a file written by
+        write_snapshot instead of downloading them.
+    """
+    if snapshot is not None:
+        with _open_snapshot(snapshot) as snapshot:
+            return _build_instances_prices(snapshot.iter_regions(urls, type, filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type), compact)
+
+    regions = _iter_ec2_instances_regions(urls, type, filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class, max_concurrency)
+    return _build_instances_prices(regions, compact)
+
+
+def _build_instances_prices(regions, compact=False):
+    """ The get_*_prices result for the (region, instance types) pairs in regions """
+    result_regions = []
+    result = {
+        "config": {
+            "currency": DEFAULT_CURRENCY,
+            "unit": "perhr"
+        },
+        "regions": result_regions
+    }
+
+    for region_name, instance_types in regions:
+        if compact:
+            instance_types = [InstanceTypePrice.from_dict(it) for it in instance_types]
+
+        result_regions.append({
+            "region": region_name,
+            "instanceTypes": instance_types
+        })
+
+    return result
+
+
+def _iter_ec2_instances_regions(urls, type, filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """ Iterator of (region, instance types) for every region of every url, in url order """
+    return _iter_regions_by_type([(type, urls)], filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class, max_concurrency)[0]
+
+
+def _iter_regions_by_type(urls_by_type, filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """ An _iter_ec2_instances_regions iterator for each (type, urls) pair of urls_by_type.
+        The files of all of them are fetched concurrently, before any is returned.
+    """
+    urls_by_type = [(type, _filter_urls_by_os_type(urls, type, filter_os_type)) for type, urls in urls_by_type]
+    jobs = [(type, u) for type, urls in urls_by_type for u in urls]
+
+    if PARSE_PROCESSES and not use_cache:
+        pool = _get_process_pool()
+        settings = dict((name, globals()[name]) for name in _PROCESS_SETTINGS)
+
+        def submit(job):
+            type, url = job
+            body, _ = _download(url)
+            return pool.apply_async(_transform_in_process, ((url, body, type, filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, INSTRUMENTATION is not None, settings),))
+
+        # each file is parsed and transformed in the process pool as soon as its download finishes
+        pending = _run_concurrently(submit, jobs, max_concurrency)
+        iter_regions = lambda type, urls, pending: _unpack_regions(_iter_process_results(pending))
+    else:
+        if not use_cache and (filter_region is not None or filter_instance_type is not None or filter_instance_type_pattern is not None):
+            # nothing is cached, so only the filtered regions and sizes need to be parsed
+            pending = _run_concurrently(lambda job: _parse_filtered_payload(_download(job[1])[0], job[0], filter_region, filter_instance_type, filter_instance_type_pattern), jobs, max_concurrency)
+        else:
+            pending = _load_data_many([u for _, u in jobs], use_cache=use_cache, cache_class=cache_class, max_concurrency=max_concurrency)
+        iter_regions = lambda type, urls, payloads: _iter_payloads_regions(urls, payloads, type, filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type)
+
+    # hand the results back per type, the merge below still walks the urls in order
+    iterators = []
+    i = 0
+    for type, urls in urls_by_type:
+        iterators.append(iter_regions(type, urls, pending[i:i + len(urls)]))
+        i += len(urls)
+
+    return iterators
+
+
+def _parse_filtered_payload(request, type, filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None):
+    filter_region = _json_region_filters(type, filter_region)
+
+    keep_instance_type = None
+    if filter_instance_type is not None or filter_instance_type_pattern is not None:
+        filter_instance_type = _filter_set(filter_instance_type)
+        type_pattern_re = _instance_type_pattern_re(filter_instance_type_pattern)
+
+        def keep_instance_type(size):
+            _type = _normalize_instance_type(size)
+            if filter_instance_type is not None and _type not in filter_instance_type:
+                return False
+            return type_pattern_re is None or type_pattern_re.match(_type) is not None
+
+    return _parse_payload(request, filter_region, keep_instance_type)
+
+
+_process_pool = None
+_process_pool_size = None
+_process_pool_lock = threading.Lock()
+
+# module settings the transform reads, sent along with every file since the pool
+# processes are started afresh rather than forked and don't see later changes to them
+_PROCESS_SETTINGS = (
+    "DEFAULT_CURRENCY",
+    "JS_LITERAL_FIXUP",
+    "JSON_NAME_TO_EC2_REGIONS_API",
+    "EC2_REGIONS_API_TO_JSON_NAME",
+    "EC2_INSTANCE_TYPES_PATTERN",
+    "INSTANCES_ONDEMAND_OS_TYPE_BY_URL",
+    "INSTANCES_RESERVED_OS_TYPE_BY_URL",
+    "INSTANCES_RESERVED_UTILIZATION_TYPE_BY_URL"
+)
+
+
+def _process_pool_context():
+    """ forkserver or spawn, so pool processes aren't forked from a process running the fetch threads """
+    if not hasattr(multiprocessing, "get_context"):
+        # Python 2 can only fork
+        return multiprocessing
+
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _get_process_pool():
+    global _process_pool, _process_pool_size
+
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool_size != PARSE_PROCESSES:
+            if _process_pool is not None:
+                _process_pool.terminate()
+            _process_pool = _process_pool_context().Pool(PARSE_PROCESSES)
+            _process_pool_size = PARSE_PROCESSES
+
+        return _process_pool
+
+
+def _close_process_pool():
+    """ Let the pool processes finish and exit """
+    global _process_pool, _process_pool_size
+
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.close()
+            _process_pool.join()
+            _process_pool = None
+            _process_pool_size = None
+
+
+atexit.register(_close_process_pool)
+
+
+class _InstrumentationLog(object):
+    """ Records timing() and incr() calls so they can be replayed in another process """
+
+    def __init__(self):
+        self.calls = []
+
+    def timing(self, stage, seconds, nbytes=0):
+        self.calls.append(("timing", (stage, seconds, nbytes)))
+
+    def incr(self, counter, n=1):
+        self.calls.append(("incr", (counter, n)))
+
+
+def _transform_in_process(args):
+    """ Runs in a pool process: parse a pricing file and return its regions as plain tuples,
+        which pickle much smaller and faster than the nested dicts, along with the
+        instrumentation calls made meanwhile when timed.
+    """
+    global INSTRUMENTATION
+
+    url, body, type, filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, timed, settings = args
+    globals().update(settings)
+
+    log = INSTRUMENTATION = _InstrumentationLog() if timed else None
+    try:
+        payload = _parse_filtered_payload(body, type, filter_region, filter_instance_type, filter_instance_type_pattern)
+        regions = []
+        for region_name, instance_types in _iter_payloads_regions([url], [payload], type, filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type):
+            regions.append((region_name, [(it["type"], it["os"], it["utilization"], "price" in it, [(term, price["hourly"], price["upfront_perGB"]) for term, price in it["prices"].items()]) for it in instance_types]))
+    finally:
+        INSTRUMENTATION = None
+
+    return regions, log.calls if log is not None else None
+
+
+def _iter_process_results(pending):
+    """ The packed regions of _transform_in_process results, replaying their instrumentation calls here """
+    for result in pending:
+        regions, calls = result.get()
+
+        instrumentation = INSTRUMENTATION
+        if calls and instrumentation is not None:
+            for name, call_args in calls:
+                getattr(instrumentation, name)(*call_args)
+
+        for packed in regions:
+            yield packed
+
+
+def _unpack_regions(packed_regions):
+    for region_name, instance_types in packed_regions:
+        yield region_name, [_make_instance_type(_type, os_type, utilization, dict((term, {"hourly": hourly, "upfront_perGB": upfront}) for term, hourly, upfront in prices), has_price) for _type, os_type, utilization, has_price, prices in instance_types]
+
+
+def _make_instance_type(type, os_type, utilization, prices, has_price=True):
+    """ An instance type dict with the same keys, in the same order, as the ones built from the pricing files """
+    if not has_price:
+        return {
+            "type": type,
+            "os": os_type,
+            "utilization": utilization,
+            "prices": prices
+        }
+
+    return {
+        "type": type,
+        "os": os_type,
+        "price": list(prices.values())[0]["hourly"],
+        "prices": prices,
+        "utilization": utilization
+    }
+
+
+def _filter_urls_by_os_type(urls, type, filter_os_type=None):
+    """ On-demand and reserved prices come in a file per OS, skip the files of other OSes """
+    if filter_os_type is None:
+        return urls
+
+    filter_os_type = _filter_set(filter_os_type)
+    if type == "ondemand":
+        return [u for u in urls if INSTANCES_ONDEMAND_OS_TYPE_BY_URL[u] in filter_os_type]
+    elif type == "reserved":
+        return [u for u in urls if INSTANCES_RESERVED_OS_TYPE_BY_URL[u] in filter_os_type]
+
+    return urls
+
+
+def _iter_payloads_regions(urls, payloads, type, filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None):
+    """ Iterator of (region, instance types) for every region of the parsed payloads of urls """
+    regions = _generate_payloads_regions(urls, payloads, type, filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type)
+    if INSTRUMENTATION is not None:
+        regions = _timed_iter("transform", regions)
+
+    return regions
+
+
+def _filter_set(value):
+    """ The frozenset of values of a filter given as a single value or as a collection of them,
+        None when not filtering
+    """
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return frozenset(value)
+    return frozenset([value])
+
+
+def _json_region_filters(type, filter_region):
+    """ _filter_set of filter_region, with the names used in the pricing files of type """
+    if filter_region is None:
+        return None
+    return frozenset(_json_region_filter(type, r) for r in _filter_set(filter_region))
+
+
+def _instance_type_pattern_re(filter_instance_type_pattern):
+    """ A single regular expression matching any of the EC2_INSTANCE_TYPES_PATTERN keys in the filter """
+    if filter_instance_type_pattern is None:
+        return None
+    return re.compile("|".join("(?:%s)" % EC2_INSTANCE_TYPES_PATTERN[p] for p in sorted(_filter_set(filter_instance_type_pattern))))
+
+
+def _json_region_filter(type, filter_region):
+    """ The name of filter_region in the pricing files of type """
+    # spot instance JSON not using the real region names
+    if type == "spot":
+        return EC2_REGIONS_API_TO_JSON_NAME[filter_region]
+
+    # except for us-east-1, reserved instance JSON uses the real region names
+    if type == "reserved" and filter_region == 'us-east-1':
+        return EC2_REGIONS_API_TO_JSON_NAME[filter_region]
+
+    return filter_region
+
+
+def _normalize_instance_type(instance_size):
+    """ The instance type of a size in the pricing files """
+    _type = instance_size
+    if _type == "cc1.8xlarge":
+        # Fix conflict where cc1 and cc2 share the same type
+        _type = "cc2.8xlarge"
+
+    # Clean the "*" the appears in the r3 instance
+    if _type.find("*") > -1:
+        _type = _type.replace("*", "").strip()
+
+    return _type
+
+
+def _generate_payloads_regions(urls, payloads, type, filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, snapshot_flags=False):
+    # every filter can hold several values, they are matched against sets in one pass.
+    # With snapshot_flags, a list of the _SNAPSHOT_OS_FILTERED / _SNAPSHOT_TYPE_FILTERED
+    # flags of each instance type (which filters it is subject to) is yielded as well.
+    filter_region = _json_region_filters(type, filter_region)
+    filter_instance_type = _filter_set(filter_instance_type)
+    filter_os_type = _filter_set(filter_os_type)
+    type_pattern_re = _instance_type_pattern_re(filter_instance_type_pattern)
+
+    get_specific_region = (filter_region is not None)
+    get_specific_instance_type = (filter_instance_type is not None)
+    get_specific_os_type = (filter_os_type is not None)
+    get_specific_instance_type_pattern = (type_pattern_re is not None)
+
+    currency = DEFAULT_CURRENCY
+
+    os_type = None
+    utilization_type = type
+
+    for u, data in zip(urls, payloads):
+        if type == "ondemand":
+            os_type = INSTANCES_ONDEMAND_OS_TYPE_BY_URL[u]
+        elif type == "reserved":
+            utilization_type = INSTANCES_RESERVED_UTILIZATION_TYPE_BY_URL[u]
+            os_type = INSTANCES_RESERVED_OS_TYPE_BY_URL[u]
+
+        if not("config" in data and data["config"] and "regions" in data["config"] and data["config"]["regions"]): continue
+
+        for r in data["config"]["regions"]:
+            if "region" not in r or not r["region"]: continue
+
+            if get_specific_region and r["region"] not in filter_region:
+                continue
+
+            region_name = JSON_NAME_TO_EC2_REGIONS_API[r["region"]]
+            instance_types = []
+            flags = []
+
+            types = r["instanceTypes"] if "instanceTypes" in r else r["types"] if "types" in r else None
+            if types is None: continue
+
+            for it in types:
+                if "sizes" in it:
+                    for s in it["sizes"]:
+                        _type = _normalize_instance_type(s["size"])
+
+                        if get_specific_instance_type and _type not in filter_instance_type:
+                            continue
+
+                        if get_specific_instance_type_pattern and type_pattern_re.match(_type) is None:
+                            continue
+
+                        if type == "emr":
+                            for price_data in s["valueColumns"]:
+                                if price_data[u'name'] != 'emr':
+                                    continue
+                                price = None
+                                try:
+                                    if price_data["prices"][currency]:
+                                        price = float(price_data["prices"][currency])
+                                except ValueError:
+                                    price = None
+
+                                instance_types.append({
+                                        "type": _type,
+                                        "os": 'emr',
+                                        "price": price,
+                                        "prices": {
+                                            type: {
+                                                "hourly": price,
+                                                "upfront_perGB": none_as_string(0)
+                                            }
+                                        },
+                                        "utilization": type
+                                })
+                                if snapshot_flags:
+                                    flags.append(_SNAPSHOT_TYPE_FILTERED)
+                        if type == "reserved":
+                            prices = {
+                                "1year": {
+                                    "hourly": None,
+                                    "upfront_perGB": None
+                                },
+                                "3year": {
+                                    "hourly": None,
+                                    "upfront_perGB": None
+                                }
+                            }
+                            instance_types.append({
+                                "type": _type,
+                                "os": os_type,
+                                "utilization": utilization_type,
+                                "prices": prices
+                            })
+                            if snapshot_flags:
+                                flags.append(_SNAPSHOT_TYPE_FILTERED)
+
+                        for price_data in s["valueColumns"]:
+                            price = None
+                            try:
+                                if price_data["prices"][currency]:
+                                    price = float(price_data["prices"][currency])
+                            except ValueError:
+                                price = None
+
+                            if type == "reserved":
+                                if price_data["name"] == "yrTerm1":
+                                    prices["1year"]["upfront_perGB"] = price
+                                elif price_data["name"] == "yrTerm1Hourly":
+                                    prices["1year"]["hourly"] = price
+                                elif price_data["name"] == "yrTerm3":
+                                    prices["3year"]["upfront_perGB"] = price
+                                elif price_data["name"] == "yrTerm3Hourly":
+                                    prices["3year"]["hourly"] = price
+                            else:
+                                if type != "spot" and price_data["name"] == "os":
+                                    price_data["name"] = "test"
+
+                                if get_specific_os_type and price_data["name"] not in filter_os_type:
+                                    continue
+
+                                instance_types.append({
+                                    "type": _type,
+                                    "os": price_data["name"],
+                                    "price": price,
+                                    "prices": {
+                                        type: {
+                                            "hourly": price,
+                                            "upfront_perGB": none_as_string(0)
+                                        }
+                                    },
+                                    "utilization": type
+                                })
+                                if snapshot_flags:
+                                    flags.append(_SNAPSHOT_OS_FILTERED | _SNAPSHOT_TYPE_FILTERED)
+                elif "values" in it:
+                    assert len(it["values"]) == 2
+
+                    perELBHour = it["values"][0]
+                    GBProcessed = it["values"][1]
+                    assert perELBHour["rate"] == "perELBHour"
+                    assert GBProcessed["rate"] == "perGBProcessed"
+
+                    instance_types.append({
+                        "type": 'elb',
+                        "os": 'elb',
+                        "price": float(perELBHour["prices"][currency]),
+                        "prices": {
+                            "perGBProcessed": {
+                                "hourly": float(perELBHour["prices"][currency]),
+                                "upfront_perGB": float(GBProcessed["prices"][currency])
+                            }
+                        },
+                        "utilization": 'elb',
+                    })
+                    if snapshot_flags:
+                        flags.append(0)
+
+            if snapshot_flags:
+                yield JSON_NAME_TO_EC2_REGIONS_API[region_name], instance_types, flags
+            else:
+                yield JSON_NAME_TO_EC2_REGIONS_API[region_name], instance_types
+
+
+def get_emr_instances_prices(filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY, compact=False, snapshot=None):
+    urls = INSTANCES_EMR_URLS
+    result = get_ec2_instances_prices(urls, "emr", filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class, max_concurrency, compact, snapshot)
+
+    return result
+
+def get_ec2_reserved_instances_prices(filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY, compact=False, snapshot=None):
+    """ Get EC2 reserved instances prices. Results can be filtered by region """
+
+    urls = INSTANCES_RESERVED_URLS
+
+    result = get_ec2_instances_prices(urls, "reserved", filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class, max_concurrency, compact, snapshot)
+
+    return result
+
+
+def get_ec2_ondemand_instances_prices(filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY, compact=False, snapshot=None):
+    """ Get EC2 on-demand instances prices. Results can be filtered by region """
+
+    urls = INSTANCES_ON_DEMAND_URLS
+
+    result = get_ec2_instances_prices(urls, "ondemand", filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class, max_concurrency, compact, snapshot)
+
+    return result
+
+
+def get_ec2_spot_instances_prices(filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY, compact=False, snapshot=None):
     """ Get EC2 spot instances prices. Results can be filtered by region """
 
-    urls = [
-        INSTANCES_SPOT_INSTANCE_URL
-    ]
+    urls = INSTANCES_SPOT_URLS
 
-    result = get_ec2_instances_prices(urls, "spot", filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class)
+    result = get_ec2_instances_prices(urls, "spot", filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class, max_concurrency, compact, snapshot)
 
     return result
 
 
-def get_elb_instances_prices(filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache):
+def get_elb_instances_prices(filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY, compact=False, snapshot=None):
 
-    urls = [
-        INSTANCES_ELB_URL
-    ]
+    urls = INSTANCES_ELB_URLS
 
-    result = get_ec2_instances_prices(urls, "elb", filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class)
+    result = get_ec2_instances_prices(urls, "elb", filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class, max_concurrency, compact, snapshot)
 
     return result
 
 
+PRICE_GETTERS = {
+    "ondemand": get_ec2_ondemand_instances_prices,
+    "reserved": get_ec2_reserved_instances_prices,
+    "spot": get_ec2_spot_instances_prices,
+    "elb": get_elb_instances_prices,
+    "emr": get_emr_instances_prices,
+}
+
+
+class PriceIndex(object):
+    """ Point lookups over the results of the get_*_prices functions.
+
+    Prices are keyed by (region, type, os, utilization, term) with secondary
+    indexes by instance type and by region. Every result is added under a
+    category name (e.g. "spot") so a single category can be replaced when it
+    is refreshed without rebuilding the rest:
+
+    index = PriceIndex(ondemand=get_ec2_ondemand_instances_prices(), spot=get_ec2_spot_instances_prices())
+    index.get("us-east-1", "m1.small", "linux", "ondemand", "ondemand")
+    index.update("spot", get_ec2_spot_instances_prices())
+    """
+
+    def __init__(self, **categories):
+        self._prices = {}
+        self._owner = {}
+        self._by_type = {}
+        self._by_region = {}
+        self._keys_by_category = {}
+
+        for category, data in categories.items():
+            self.update(category, data)
+
+    def update(self, category, data):
+        """ Replace all prices of category with the ones in data """
+        self.remove(category)
+
+        keys = []
+        for r in data["regions"]:
+            region_name = r["region"]
+            for it in r["instanceTypes"]:
+                for term, price in it["prices"].items():
+                    key = (region_name, it["type"], it["os"], it["utilization"], term)
+                    self._prices[key] = price
+                    self._owner[key] = category
+                    self._by_type.setdefault(it["type"], set()).add(key)
+                    self._by_region.setdefault(region_name, set()).add(key)
+                    keys.append(key)
+
+        self._keys_by_category[category] = keys
+
+    def remove(self, category):
+        """ Drop all prices added under category """
+        for key in self._keys_by_category.pop(category, ()):
+            # the key may have been taken over by a later category
+            if self._owner.get(key) != category:
+                continue
+
+            del self._prices[key]
+            del self._owner[key]
+            self._discard(self._by_type, key[1], key)
+            self._discard(self._by_region, key[0], key)
+
+    @staticmethod
+    def _discard(index, name, key):
+        keys = index[name]
+        keys.discard(key)
+        if not keys:
+            del index[name]
+
+    def get(self, region, type, os, utilization, term, default=None):
+        """ The {"hourly": ..., "upfront_perGB": ...} prices of a single key """
+        return self._prices.get((region, type, os, utilization, term), default)
+
+    def by_type(self, type):
+        """ {key: prices} of every price of an instance type """
+        return dict((key, self._prices[key]) for key in self._by_type.get(type, ()))
+
+    def by_region(self, region):
+        """ {key: prices} of every price in a region """
+        return dict((key, self._prices[key]) for key in self._by_region.get(region, ()))
+
+    def by_category(self, category):
+        """ {key: prices} of every price added under category """
+        return dict((key, self._prices[key]) for key in self._keys_by_category.get(category, ()) if self._owner.get(key) == category)
+
+    def select(self, categories=None, region=None, type=None, type_pattern=None, os=None, utilization=None, term=None):
+        """ [(key, prices)] matching all given filters, sorted by key. region, type, os, utilization
+            and term take a single value or a list (set, tuple) of values.
+            type_pattern is a compiled regular expression matched against the instance type.
+        """
+        region, type, os, utilization, term = [_filter_set(v) for v in (region, type, os, utilization, term)]
+
+        if None not in (region, type, os, utilization, term):
+            candidates = [key for key in itertools.product(region, type, os, utilization, term) if key in self._prices]
+        elif region is not None and type is not None:
+            candidates = self._union(self._by_region, region) & self._union(self._by_type, type)
+        elif region is not None:
+            candidates = self._union(self._by_region, region)
+        elif type is not None:
+            candidates = self._union(self._by_type, type)
+        else:
+            candidates = self._prices
+
+        result = []
+        for key in candidates:
+            if os is not None and key[2] not in os:
+                continue
+            if utilization is not None and key[3] not in utilization:
+                continue
+            if term is not None and key[4] not in term:
+                continue
+            if type_pattern is not None and type_pattern.match(key[1]) is None:
+                continue
+            if categories is not None and self._owner[key] not in categories:
+                continue
+            result.append((key, self._prices[key]))
+
+        result.sort(key=lambda item: item[0])
+        return result
+
+    @staticmethod
+    def _union(index, names):
+        keys = set()
+        for name in names:
+            keys.update(index.get(name, ()))
+        return keys
+
+    def categories(self):
+        return list(self._keys_by_category)
+
+    def types(self):
+        return list(self._by_type)
+
+    def regions(self):
+        return list(self._by_region)
+
+    def __contains__(self, key):
+        return key in self._prices
+
+    def __getitem__(self, key):
+        return self._prices[key]
+
+    def __iter__(self):
+        return iter(self._prices)
+
+    def __len__(self):
+        return len(self._prices)
+
+    def items(self):
+        return self._prices.items()
+
+
+def get_price_index(categories=("ondemand", "reserved", "spot", "elb", "emr"), filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY, snapshot=None):
+    """ Build a PriceIndex of the given price categories (keys of PRICE_GETTERS) """
+    index = PriceIndex()
+    for category in categories:
+        index.update(category, PRICE_GETTERS[category](filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class, max_concurrency=max_concurrency, snapshot=snapshot))
+
+    return index
+
+
+def get_prices_by_region(types=("ondemand", "reserved", "spot", "elb", "emr"), filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY, compact=False, snapshot=None):
+    """ Get the prices of several price types (keys of INSTANCES_URLS_BY_TYPE) as a single get_*_prices
+        style result with one entry per region, along with its region -> type -> utilization -> instance
+        type index (for a single OS, a warning is issued when several share an entry and only the first
+        is kept). The files of all the types are fetched concurrently and walked once.
+    """
+    if snapshot is not None:
+        with _open_snapshot(snapshot) as snapshot:
+            return _merge_regions_by_type([snapshot.iter_regions(INSTANCES_URLS_BY_TYPE[type], type, filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type) for type in types], compact)
+
+    return _merge_regions_by_type(_iter_regions_by_type([(type, INSTANCES_URLS_BY_TYPE[type]) for type in types], filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class, max_concurrency), compact)
+
+
+def _merge_regions_by_type(iterators, compact=False):
+    """ get_prices_by_region of the region iterators of each price type """
+    result = _build_instances_prices((), compact)
+    regions = dict()
+    by_region = dict()
+    collisions = 0
+    for region_name, instance_types in itertools.chain(*iterators):
+        region = regions.get(region_name)
+        if region is None:
+            region = regions[region_name] = {
+                "region": region_name,
+                "instanceTypes": []
+            }
+            result["regions"].append(region)
+            by_region[region_name] = dict()
+
+        if compact:
+            instance_types = [InstanceTypePrice.from_dict(it) for it in instance_types]
+        region["instanceTypes"].extend(instance_types)
+        collisions += _index_instance_types(by_region[region_name], instance_types)
+
+    _warn_index_collisions(collisions)
+    return result, by_region
+
+
+def _index_instance_types(by_type, instance_types):
+    """ Add instance_types to a type -> utilization index, returns how many were already in it """
+    collisions = 0
+    for it in instance_types:
+        by_utilization = by_type.setdefault(it["type"], dict())
+        if it["utilization"] in by_utilization:
+            collisions += 1
+        else:
+            by_utilization[it["utilization"]] = it
+
+    return collisions
+
+
+def _index_by_region(data):
+    """ region -> type -> utilization -> instance type index of a get_*_prices result """
+    by_region = dict()
+    collisions = 0
+    for r in data["regions"]:
+        collisions += _index_instance_types(by_region.setdefault(r["region"], dict()), r["instanceTypes"])
+
+    _warn_index_collisions(collisions)
+    return by_region
+
+
+def _warn_index_collisions(collisions):
+    if collisions:
+        warnings.warn("%d instance types share their region, type and utilization with another one and are left out of "
+                      "the index, which holds the first of each (filter_os_type should select a single OS)" % collisions, stacklevel=3)
+
+
+PriceRecord = collections.namedtuple("PriceRecord", ["region", "type", "os", "utilization", "term", "hourly", "upfront"])
+
+
+def iter_prices(types=("ondemand", "reserved", "spot", "elb", "emr"), filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY, snapshot=None):
+    """ Yield a flat PriceRecord per price of the given price types (keys of INSTANCES_URLS_BY_TYPE),
+        without building the nested structure returned by the get_*_prices functions.
+        "upfront" holds the upfront (reserved) or per GB (elb) price.
+    """
+    if snapshot is not None:
+        # closed once every record was yielded, or when the generator is
+        with _open_snapshot(snapshot) as snapshot:
+            for record in _iter_price_records([snapshot.iter_regions(INSTANCES_URLS_BY_TYPE[type], type, filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type) for type in types]):
+                yield record
+        return
+
+    for record in _iter_price_records(_iter_regions_by_type([(type, INSTANCES_URLS_BY_TYPE[type]) for type in types], filter_region, filter_instance_type, filter_instance_type_pattern, filter_os_type, use_cache, cache_class, max_concurrency)):
+        yield record
+
+
+def _iter_price_records(iterators):
+    """ PriceRecords of the (region, instance types) pairs of the region iterators """
+    for region_name, instance_types in itertools.chain(*iterators):
+        for it in instance_types:
+            for term, price in it["prices"].items():
+                yield PriceRecord(region_name, it["type"], it["os"], it["utilization"], term, price["hourly"], price["upfront_perGB"])
+
+
+SNAPSHOT_MAGIC = b"EC2PSNP1"
+
+DEFAULT_SNAPSHOT_FILE = "ec2instancespricing.snapshot"
+
+# magic, creation time, then the number of strings, urls, regions, instance types and terms
+_SNAPSHOT_HEADER = struct.Struct("<8sdIIIII")
+# url, price type, first region, region count
+_SNAPSHOT_URL = struct.Struct("<IIII")
+# JSON region name, region, first instance type, instance type count
+_SNAPSHOT_REGION = struct.Struct("<IIII")
+# type, os, utilization, flags, term count, first term
+_SNAPSHOT_INSTANCE_TYPE = struct.Struct("<IIIBBI")
+# term, hourly (kind, value), upfront_perGB (kind, value)
+_SNAPSHOT_TERM = struct.Struct("<IBdBd")
+
+# instance type flags
+_SNAPSHOT_RESERVED = 1     # no "price" key, like the reserved prices
+_SNAPSHOT_OS_FILTERED = 2  # dropped when filter_os_type doesn't match its os
+_SNAPSHOT_TYPE_FILTERED = 4  # dropped when the instance type filters don't match its type
+
+# value kinds, a string value holds its index in the string table
+_SNAPSHOT_NONE = 0
+_SNAPSHOT_FLOAT = 1
+_SNAPSHOT_STRING = 2
+
+
+def write_snapshot(path=DEFAULT_SNAPSHOT_FILE, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """ Download every price type and write the normalized prices to a snapshot file.
+
+    The file is a string table followed by fixed size url, region, instance type
+    and term records, so PriceSnapshot can answer queries straight from a memory map.
+    It is written to a temporary file and renamed into place.
+    """
+    string_ids = {}
+    url_records = []
+    region_records = []
+    instance_type_records = []
+    term_records = []
+
+    def string(s):
+        i = string_ids.get(s)
+        if i is None:
+            i = string_ids[s] = len(string_ids)
+        return i
+
+    def value(v):
+        if v is None:
+            return _SNAPSHOT_NONE, 0.0
+        if isinstance(v, float):
+            return _SNAPSHOT_FLOAT, v
+        return _SNAPSHOT_STRING, float(string(v))
+
+    types = ["ondemand", "reserved", "spot", "elb", "emr"]
+    urls = [u for type in types for u in INSTANCES_URLS_BY_TYPE[type]]
+    payloads = dict(zip(urls, _load_data_many(urls, use_cache=use_cache, cache_class=cache_class, max_concurrency=max_concurrency)))
+
+    for type in types:
+        for u in INSTANCES_URLS_BY_TYPE[type]:
+            url_records.append((string(u), string(type), len(region_records), 0))
+
+            for r in (payloads[u].get("config") or {}).get("regions") or []:
+                # one region at a time, to keep its JSON name for filter_region
+                payload = {"config": {"regions": [r]}}
+                for region_name, instance_types, filter_flags in _generate_payloads_regions([u], [payload], type, snapshot_flags=True):
+                    region_records.append((string(r["region"]), string(region_name), len(instance_type_records), len(instance_types)))
+
+                    for it, flags in zip(instance_types, filter_flags):
+                        if "price" not in it:
+                            flags |= _SNAPSHOT_RESERVED
+
+                        instance_type_records.append((string(it["type"]), string(it["os"]), string(it["utilization"]), flags, len(it["prices"]), len(term_records)))
+                        for term, price in it["prices"].items():
+                            term_records.append((string(term),) + value(price["hourly"]) + value(price["upfront_perGB"]))
+
+            url_records[-1] = url_records[-1][:3] + (len(region_records) - url_records[-1][2],)
+
+    strings = [None] * len(string_ids)
+    for s, i in string_ids.items():
+        strings[i] = s.encode('utf8')
+
+    string_offsets = [0]
+    for s in strings:
+        string_offsets.append(string_offsets[-1] + len(s))
+
+    chunks = [
+        _SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, time.time(), len(strings), len(url_records), len(region_records), len(instance_type_records), len(term_records)),
+        struct.pack("<%dI" % len(string_offsets), *string_offsets)
+    ]
+    chunks.extend(_SNAPSHOT_URL.pack(*record) for record in url_records)
+    chunks.extend(_SNAPSHOT_REGION.pack(*record) for record in region_records)
+    chunks.extend(_SNAPSHOT_INSTANCE_TYPE.pack(*record) for record in instance_type_records)
+    chunks.extend(_SNAPSHOT_TERM.pack(*record) for record in term_records)
+    chunks.extend(strings)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"".join(chunks))
+        _publish_file(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+class PriceSnapshot(object):
+    """ Read-only view of a file written by write_snapshot.
+
+    The file is memory-mapped and only the records a query reaches are decoded,
+    so opening it and answering a query takes milliseconds.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.created, string_count, url_count, region_count, instance_type_count, term_count = _SNAPSHOT_HEADER.unpack_from(self._map, 0)
+        if magic != SNAPSHOT_MAGIC:
+            self._map.close()
+            raise ValueError("%s is not a pricing snapshot" % path)
+
+        offset = _SNAPSHOT_HEADER.size
+        string_offsets = struct.unpack_from("<%dI" % (string_count + 1), self._map, offset)
+        offset += 4 * (string_count + 1)
+        urls_offset = offset
+        offset += url_count * _SNAPSHOT_URL.size
+        self._regions_offset = offset
+        offset += region_count * _SNAPSHOT_REGION.size
+        self._instance_types_offset = offset
+        offset += instance_type_count * _SNAPSHOT_INSTANCE_TYPE.size
+        self._terms_offset = offset
+        offset += term_count * _SNAPSHOT_TERM.size
+
+        # a few hundred names (regions, types, terms...), decoding them all is cheap
+        self._strings = [self._map[offset + string_offsets[i]:offset + string_offsets[i + 1]].decode('utf8') for i in range(string_count)]
+
+        self._urls = {}
+        for i in range(url_count):
+            url, type, first_region, count = _SNAPSHOT_URL.unpack_from(self._map, urls_offset + i * _SNAPSHOT_URL.size)
+            self._urls[self._strings[url]] = (self._strings[type], first_region, count)
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _value(self, kind, value):
+        if kind == _SNAPSHOT_FLOAT:
+            return value
+        if kind == _SNAPSHOT_STRING:
+            return self._strings[int(value)]
+        return None
+
+    def iter_regions(self, urls, type, filter_region=None, filter_instance_type=None, filter_instance_type_pattern=None, filter_os_type=None):
+        """ The (region, instance types) pairs downloading urls would have produced """
+        filter_region = _json_region_filters(type, filter_region)
+        filter_instance_type = _filter_set(filter_instance_type)
+        type_pattern_re = _instance_type_pattern_re(filter_instance_type_pattern)
+        filter_os_types = _filter_set(filter_os_type)
+
+        strings = self._strings
+        for u in _filter_urls_by_os_type(urls, type, filter_os_type):
+            if u not in self._urls:
+                raise ValueError("%s is not in the snapshot" % u)
+
+            _, first_region, region_count = self._urls[u]
+            for i in range(first_region, first_region + region_count):
+                json_name, region_name, first_instance_type, instance_type_count = _SNAPSHOT_REGION.unpack_from(self._map, self._regions_offset + i * _SNAPSHOT_REGION.size)
+                if filter_region is not None and strings[json_name] not in filter_region:
+                    continue
+
+                instance_types = []
+                for j in range(first_instance_type, first_instance_type + instance_type_count):
+                    _type, os_type, utilization, flags, term_count, first_term = _SNAPSHOT_INSTANCE_TYPE.unpack_from(self._map, self._instance_types_offset + j * _SNAPSHOT_INSTANCE_TYPE.size)
+                    _type = strings[_type]
+                    if flags & _SNAPSHOT_TYPE_FILTERED:
+                        if filter_instance_type is not None and _type not in filter_instance_type:
+                            continue
+                        if type_pattern_re is not None and type_pattern_re.match(_type) is None:
+                            continue
+                    if filter_os_types is not None and flags & _SNAPSHOT_OS_FILTERED and strings[os_type] not in filter_os_types:
+                        continue
+
+                    prices = {}
+                    for k in range(first_term, first_term + term_count):
+                        term, hourly_kind, hourly, upfront_kind, upfront = _SNAPSHOT_TERM.unpack_from(self._map, self._terms_offset + k * _SNAPSHOT_TERM.size)
+                        prices[strings[term]] = {
+                            "hourly": self._value(hourly_kind, hourly),
+                            "upfront_perGB": self._value(upfront_kind, upfront)
+                        }
+
+                    instance_types.append(_make_instance_type(_type, strings[os_type], strings[utilization], prices, not flags & _SNAPSHOT_RESERVED))
+
+                yield strings[region_name], instance_types
+
+
+@contextlib.contextmanager
+def _open_snapshot(snapshot):
+    """ snapshot as a PriceSnapshot, closed afterwards if it was given as a path """
+    if isinstance(snapshot, PriceSnapshot):
+        yield snapshot
+        return
+
+    with PriceSnapshot(snapshot) as snapshot:
+        yield snapshot
+
+
+# hourly and upfront are the new prices (None when removed), previous_* the old ones (None when added)
+PriceChange = collections.namedtuple("PriceChange", ["change", "region", "type", "os", "utilization", "term", "hourly", "upfront", "previous_hourly", "previous_upfront"])
+
+
+def diff_prices(old, new):
+    """ [PriceChange] of the prices "added", "removed" or "changed" between old and new,
+        keyed by (region, type, os, utilization, term).
+
+    old and new can be get_*_prices results, snapshots (a PriceSnapshot or a path)
+    or iterables of PriceRecord, e.g. from iter_prices. A snapshot holds every price
+    type, so it can only be compared with another snapshot: to compare it with some
+    of the prices, pass iter_prices(types, filters..., snapshot=path) with the same
+    types and filters. Changes come in the order of new, followed by the removed
+    prices in the order of old.
+    """
+    if _is_snapshot(old) != _is_snapshot(new):
+        raise ValueError("diff_prices can't compare a whole snapshot with other prices, "
+                         "use iter_prices(snapshot=...) with the same price types and filters as the other side")
+
+    old_prices = collections.OrderedDict((record[:5], record[5:]) for record in _price_records(old))
+    new_prices = collections.OrderedDict((record[:5], record[5:]) for record in _price_records(new))
+
+    changes = []
+    for key, prices in new_prices.items():
+        previous = old_prices.get(key)
+        if previous is None:
+            changes.append(PriceChange("added", *(key + prices + (None, None))))
+        elif previous != prices:
+            changes.append(PriceChange("changed", *(key + prices + previous)))
+
+    for key, previous in old_prices.items():
+        if key not in new_prices:
+            changes.append(PriceChange("removed", *(key + (None, None) + previous)))
+
+    return changes
+
+
+def _price_records(prices):
+    """ PriceRecords of a get_*_prices result, a snapshot or an iterable of PriceRecord """
+    if isinstance(prices, dict):
+        return (PriceRecord(r["region"], it["type"], it["os"], it["utilization"], term, price["hourly"], price["upfront_perGB"]) for r in prices["regions"] for it in r["instanceTypes"] for term, price in it["prices"].items())
+
+    if _is_snapshot(prices):
+        return iter_prices(snapshot=prices)
+
+    return prices
+
+
+def _is_snapshot(prices):
+    return isinstance(prices, (PriceSnapshot, str, type(u"")))
+
+
+HOURS_PER_YEAR = 8760
+
+HOURS_PER_MONTH = HOURS_PER_YEAR / 12.0
+
+# the upfront price of a reservation is spread over the hours of its term
+RESERVED_TERM_HOURS = {
+    "1year": HOURS_PER_YEAR,
+    "3year": 3 * HOURS_PER_YEAR
+}
+
+PRICE_TYPE_BY_UTILIZATION = {
+    "ondemand": "ondemand",
+    "spot": "spot",
+    "light": "reserved",
+    "medium": "reserved",
+    "heavy": "reserved",
+    "elb": "elb",
+    "emr": "emr"
+}
+
+# the term of the prices of a utilization, when the inventory doesn't name one
+DEFAULT_TERM_BY_UTILIZATION = {
+    "elb": "perGBProcessed"
+}
+
+INVENTORY_FIELD_NAMES = [
+    "region",
+    "type",
+    "os",
+    "utilization",
+    "term",
+    "count",
+    "hours"
+]
+
+CostTotal = collections.namedtuple("CostTotal", ["group", "rows", "unpriced", "hourly", "monthly", "annual"])
+
+
+def _numpy():
+    """ The numpy module, imported on first use, or None """
+    global numpy
+    if numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+
+    return numpy
+
+
+def _effective_hourly(record):
+    """ Hourly price of a PriceRecord, plus its upfront price spread over the term for reservations """
+    term_hours = RESERVED_TERM_HOURS.get(record.term)
+    if term_hours is None or record.upfront is None:
+        return record.hourly
+
+    return (record.hourly or 0.0) + record.upfront / float(term_hours)
+
+
+class PriceTable(object):
+    """ Effective hourly prices keyed by (region, type, os, utilization, term), laid out so that
+        whole inventory columns can be looked up at once.
+
+    prices is anything diff_prices accepts: get_*_prices results, snapshots or PriceRecords.
+    With NumPy the keys are encoded as integers (a code per distinct value of each key
+    column). Up to DENSE_SIZE possible keys the prices are stored at their key, beyond
+    that they are kept sorted by key and looked up with a searchsorted.
+    """
+
+    DENSE_SIZE = 1 << 22
+
+    def __init__(self, prices):
+        rates = {}
+        for record in _price_records(prices):
+            rate = _effective_hourly(record)
+            if rate is not None:
+                rates[tuple(record[:5])] = rate
+
+        self._rates = rates
+        self._codes = [dict((v, i) for i, v in enumerate(sorted(set(key[c] for key in rates)))) for c in range(5)]
+
+        numpy = _numpy()
+        if numpy is not None:
+            keys = numpy.zeros(len(rates), dtype=numpy.int64)
+            for c, codes in enumerate(self._codes):
+                keys = keys * len(codes) + numpy.fromiter((codes[key[c]] for key in rates), dtype=numpy.int64, count=len(rates))
+
+            values = numpy.fromiter(rates.values(), dtype=float, count=len(rates))
+            size = 1
+            for codes in self._codes:
+                size *= len(codes)
+
+            self._dense = None
+            if size <= self.DENSE_SIZE:
+                self._dense = numpy.full(size, numpy.nan)
+                self._dense[keys] = values
+            else:
+                order = numpy.argsort(keys)
+                self._keys = keys[order]
+                self._values = values[order]
+
+    def __len__(self):
+        return len(self._rates)
+
+    def get(self, region, type, os, utilization, term, default=None):
+        return self._rates.get((region, type, os, utilization, term), default)
+
+    def lookup(self, regions, types, oses, utilizations, terms):
+        """ The prices of the keys given as columns, NaN where there's none. A NumPy array, or a list without NumPy """
+        columns = (regions, types, oses, utilizations, terms)
+        numpy = _numpy()
+        if numpy is None:
+            nan = float("nan")
+            return [self._rates.get(key, nan) for key in zip(*columns)]
+
+        n = len(regions)
+        if not self._rates:
+            return numpy.full(n, numpy.nan)
+
+        keys = numpy.zeros(n, dtype=numpy.int64)
+        known = numpy.ones(n, dtype=bool)
+        for codes, column in zip(self._codes, columns):
+            column_codes = numpy.fromiter(map(codes.get, column, itertools.repeat(-1, n)), dtype=numpy.int64, count=n)
+            known &= column_codes >= 0
+            keys = keys * len(codes) + column_codes
+
+        if self._dense is not None:
+            return numpy.where(known, self._dense[numpy.where(known, keys, 0)], numpy.nan)
+
+        positions = numpy.minimum(numpy.searchsorted(self._keys, keys), len(self._keys) - 1)
+        return numpy.where(known & (self._keys[positions] == keys), self._values[positions], numpy.nan)
+
+
+class FleetCost(object):
+    """ Costs of the rows of an inventory, see fleet_cost.
+
+    rate, hourly, monthly and annual are per row columns (NumPy arrays, or lists without
+    NumPy): the effective hourly price of an instance, and what "count" of them cost per
+    hour, per month running "hours" hours a month, and per year. Rows without a price are
+    NaN and left out of the totals.
+    """
+
+    def __init__(self, inventory, rate):
+        self.inventory = inventory
+        self.rate = rate
+        self._numpy = numpy = _numpy()
+
+        if numpy is not None:
+            self.hourly = rate * inventory["count"]
+            self.monthly = self.hourly * inventory["hours"]
+            self.annual = self.monthly * 12
+            self.priced = ~numpy.isnan(rate)
+        else:
+            self.hourly = [r * c for r, c in zip(rate, inventory["count"])]
+            self.monthly = [h * m for h, m in zip(self.hourly, inventory["hours"])]
+            self.annual = [m * 12 for m in self.monthly]
+            self.priced = [r == r for r in rate]
+
+    def __len__(self):
+        return len(self.rate)
+
+    def total(self):
+        """ CostTotal of every row """
+        numpy = self._numpy
+        if numpy is not None:
+            unpriced = len(self) - int(self.priced.sum())
+            sums = [float(numpy.nansum(column)) for column in (self.hourly, self.monthly, self.annual)]
+        else:
+            unpriced = self.priced.count(False)
+            sums = [sum((v for v in column if v == v), 0.0) for column in (self.hourly, self.monthly, self.annual)]
+
+        return CostTotal(None, len(self), unpriced, *sums)
+
+    def by(self, column):
+        """ [CostTotal] of the rows sharing each value of an inventory column, sorted by value """
+        values = self.inventory[column]
+        groups = sorted(set(values))
+        codes = dict((v, i) for i, v in enumerate(groups))
+
+        numpy = self._numpy
+        if numpy is not None:
+            group = numpy.fromiter(map(codes.get, values), dtype=numpy.int64, count=len(self))
+            rows = numpy.bincount(group, minlength=len(groups))
+            unpriced = numpy.bincount(group, weights=~self.priced, minlength=len(groups))
+            sums = [numpy.bincount(group, weights=numpy.where(self.priced, c, 0.0), minlength=len(groups)) for c in (self.hourly, self.monthly, self.annual)]
+            return [CostTotal(g, int(rows[i]), int(unpriced[i]), float(sums[0][i]), float(sums[1][i]), float(sums[2][i])) for i, g in enumerate(groups)]
+
+        totals = [[0, 0, 0.0, 0.0, 0.0] for _ in groups]
+        for value, priced, hourly, monthly, annual in zip(values, self.priced, self.hourly, self.monthly, self.annual):
+            t = totals[codes[value]]
+            t[0] += 1
+            if priced:
+                t[2] += hourly
+                t[3] += monthly
+                t[4] += annual
+            else:
+                t[1] += 1
+
+        return [CostTotal(g, *t) for g, t in zip(groups, totals)]
+
+    def rows(self):
+        """ Iterator of the INVENTORY_FIELD_NAMES values of each row followed by its hourly, monthly and annual cost (None without a price) """
+        columns = [self.inventory[name] for name in INVENTORY_FIELD_NAMES] + [self.hourly, self.monthly, self.annual]
+        numpy = self._numpy
+        if numpy is not None:
+            columns = [c.tolist() if isinstance(c, numpy.ndarray) else c for c in columns]
+
+        for row in zip(*columns):
+            yield row[:7] + tuple(v if v == v else None for v in row[7:])
+
+
+def read_inventory(path):
+    """ Read a CSV inventory ("-" for stdin) into fleet_cost columns. Its header names the
+        INVENTORY_FIELD_NAMES columns; short rows are padded with empty values, and empty
+        terms, counts and hours get the fleet_cost defaults.
+    """
+    f = sys.stdin if path == "-" else open(path)
+    try:
+        reader = csv.reader(f, skipinitialspace=True)
+        header = [name.strip() for name in next(reader, [])]
+        rows = [row for row in reader if row]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+    missing = [name for name in INVENTORY_FIELD_NAMES[:4] if name not in header]
+    if missing:
+        raise ValueError("inventory %s is missing the %s column(s)" % (path, ", ".join(missing)))
+
+    rows = [row + [""] * (len(header) - len(row)) for row in rows]
+    inventory = dict((name, [row[i] for row in rows]) for i, name in enumerate(header) if name in INVENTORY_FIELD_NAMES)
+    if "term" in inventory:
+        inventory["term"] = [t or DEFAULT_TERM_BY_UTILIZATION.get(u, u) for t, u in zip(inventory["term"], inventory["utilization"])]
+    for name, default in (("count", 1), ("hours", HOURS_PER_MONTH)):
+        if name in inventory:
+            inventory[name] = [v or default for v in inventory[name]]
+
+    return inventory
+
+
+def _inventory_prices(inventory, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY, snapshot=None):
+    """ The PriceRecords of each price type of inventory, for the regions, instance types and OSes of its own rows """
+    filters = {}
+    for region, type, os_name, utilization in zip(inventory["region"], inventory["type"], inventory["os"], inventory["utilization"]):
+        price_type = PRICE_TYPE_BY_UTILIZATION.get(utilization)
+        if price_type is None:
+            continue
+        regions, types, oses = filters.setdefault(price_type, (set(), set(), set()))
+        regions.add(region)
+        types.add(type)
+        oses.add(os_name)
+
+    def prices(price_type):
+        regions, types, oses = filters[price_type]
+        # region filters compare against the region names of each pricing file, so the
+        # regions are matched once iter_prices has normalized them to the API names
+        return [record for record in iter_prices([price_type], None, types, None, oses, use_cache, cache_class, max_concurrency, snapshot) if record.region in regions]
+
+    price_types = [t for t in PRICE_TYPES_BY_OUTPUT_TYPE["all"] if t in filters]
+    return itertools.chain(*_run_concurrently(prices, price_types, max_concurrency))
+
+
+def fleet_cost(inventory, prices=None, use_cache=False, cache_class=SimpleResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY, snapshot=None):
+    """ Price an inventory of running instances, returns a FleetCost.
+
+    inventory is a dict of INVENTORY_FIELD_NAMES columns (lists or arrays, e.g. from
+    read_inventory). "term" defaults to DEFAULT_TERM_BY_UTILIZATION or else the utilization,
+    which is also the term of the on-demand, spot and EMR prices, "count" to 1 and "hours" a
+    month to HOURS_PER_MONTH. Rows without a price cost NaN and aren't counted as priced.
+
+    prices is a PriceTable or anything it's built from. Without it, the prices of each price type
+    in the inventory are downloaded (or read from snapshot), for the regions, instance types and
+    OSes of its rows.
+    """
+    n = len(inventory["region"])
+    inventory = dict(inventory)
+    if inventory.get("term") is None:
+        inventory["term"] = [DEFAULT_TERM_BY_UTILIZATION.get(u, u) for u in inventory["utilization"]]
+
+    numpy = _numpy()
+    for name, default in (("count", 1.0), ("hours", HOURS_PER_MONTH)):
+        values = inventory.get(name)
+        if numpy is not None:
+            inventory[name] = numpy.full(n, default) if values is None else numpy.asarray(values, dtype=float)
+        else:
+            inventory[name] = [default] * n if values is None else [float(v) for v in values]
+
+    if prices is None:
+        prices = _inventory_prices(inventory, use_cache, cache_class, max_concurrency, snapshot)
+
+    if not isinstance(prices, PriceTable):
+        prices = PriceTable(prices)
+
+    return FleetCost(inventory, prices.lookup(inventory["region"], inventory["type"], inventory["os"], inventory["utilization"], inventory["term"]))
+
+
+class LatencyHistogram(object):
+    """ Thread-safe histogram of request latencies in milliseconds """
+    buckets = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+    def __init__(self):
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, ms):
+        i = 0
+        while i < len(self.buckets) and ms > self.buckets[i]:
+            i += 1
+
+        with self._lock:
+            self._counts[i] += 1
+            self._total += ms
+
+    def stats(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._total
+
+        labels = ["<=%s" % b for b in self.buckets] + [">%s" % self.buckets[-1]]
+        return {
+            "count": sum(counts),
+            "sum_ms": total,
+            "buckets_ms": collections.OrderedDict(zip(labels, counts))
+        }
+
+
+class PricingService(object):
+    """ Keeps a PriceIndex of every price category warm and refreshes it in the background.
+
+    Refreshes go through TimeBasedResultsCache, so unchanged pricing files are
+    revalidated rather than downloaded and parsed again.
+    """
+
+    def __init__(self, refresh_interval=None, cache_class=TimeBasedResultsCache, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        if refresh_interval is None:
+            refresh_interval = cache_class._default_expiration_in_seconds
+
+        self.refresh_interval = refresh_interval
+        self.cache_class = cache_class
+        self.max_concurrency = max_concurrency
+        self.histogram = LatencyHistogram()
+        self.index = None
+        self.last_refresh = None
+        self.last_refresh_error = None
+        self._stop = threading.Event()
+
+    def refresh(self):
+        index = get_price_index(PRICE_TYPES_BY_OUTPUT_TYPE["all"], filter_os_type=None, use_cache=True, cache_class=self.cache_class, max_concurrency=self.max_concurrency)
+        # swap the whole index so queries never see a half built one
+        self.index = index
+        self.last_refresh = time.time()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+                self.last_refresh_error = None
+            except Exception as e:
+                # keep serving the previous prices
+                self.last_refresh_error = repr(e)
+
+    def start(self):
+        if self.index is None:
+            self.refresh()
+
+        t = threading.Thread(target=self._refresh_loop)
+        t.daemon = True
+        t.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def query(self, params):
+        """ Prices matching the CLI filters in params (type, filter-region, filter-type, filter-type-pattern, filter-os-type) """
+        price_type = params.get("type", "all")
+        if price_type not in PRICE_TYPES_BY_OUTPUT_TYPE:
+            raise ValueError("unknown type %r" % price_type)
+
+        # comma separated values, like on the command line
+        filters = {}
+        for name, choices in (("filter-region", EC2_REGIONS), ("filter-type", EC2_INSTANCE_TYPES), ("filter-type-pattern", EC2_INSTANCE_TYPES_PATTERN), ("filter-os-type", EC2_OS_TYPES)):
+            value = params.get(name)
+            if value is not None:
+                try:
+                    filters[name] = _split_filter_values(value, choices)
+                except ValueError as e:
+                    raise ValueError("%s: %s" % (name, e))
+
+        categories = None
+        if price_type != "all":
+            categories = PRICE_TYPES_BY_OUTPUT_TYPE[price_type]
+
+        return self.index.select(categories=categories, region=filters.get("filter-region"), type=filters.get("filter-type"), type_pattern=_instance_type_pattern_re(filters.get("filter-type-pattern")), os=filters.get("filter-os-type"))
+
+    def metrics(self):
+        return {
+            "prices": len(self.index) if self.index is not None else 0,
+            "last_refresh": self.last_refresh,
+            "last_refresh_error": self.last_refresh_error,
+            "latency": self.histogram.stats(),
+            "instrumentation": INSTRUMENTATION.stats() if isinstance(INSTRUMENTATION, Instrumentation) else None
+        }
+
+
+class PricingRequestHandler(BaseHTTPRequestHandler):
+    """ GET /prices?type=...&filter-region=...&format=json|csv and GET /metrics """
+    service = None
+
+    def do_GET(self):
+        start = time.time()
+        parsed = urlparse(self.path)
+        params = dict((k, v[-1]) for k, v in parse_qs(parsed.query).items())
+
+        if parsed.path == "/prices":
+            try:
+                rows = self.service.query(params)
+            except ValueError as e:
+                self._send(400, "text/plain", str(e))
+                return
+
+            if params.get("format", "json") == "csv":
+                lines = [','.join(OUTPUT_FIELD_NAMES)]
+                for key, prices in rows:
+                    lines.append("%s,%s,%s,%s,%s,%s,%s" % (key[0], key[1], key[2], none_as_string(prices["hourly"]), key[3], key[4], none_as_string(prices["upfront_perGB"])))
+                self._send(200, "text/csv", "\n".join(lines) + "\n")
+            else:
+                records = [PriceRecord(key[0], key[1], key[2], key[3], key[4], prices["hourly"], prices["upfront_perGB"])._asdict() for key, prices in rows]
+                self._send(200, "application/json", json.dumps(records))
+
+            self.service.histogram.observe((time.time() - start) * 1000)
+        elif parsed.path == "/metrics":
+            self._send(200, "application/json", json.dumps(self.service.metrics()))
+        else:
+            self._send(404, "text/plain", "not found")
+
+    def _send(self, status, content_type, body):
+        body = body.encode('utf8')
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve_prices(host="127.0.0.1", port=8080, refresh_interval=None, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """ Serve price queries over HTTP until interrupted """
+    service = PricingService(refresh_interval=refresh_interval, max_concurrency=max_concurrency)
+    service.start()
+
+    handler = type("BoundPricingRequestHandler", (PricingRequestHandler,), {"service": service})
+    server = ThreadedHTTPServer((host, port), handler)
+    try:
+        server.serve_forever()
+    finally:
+        service.stop()
+        server.server_close()
+
+
+def _split_filter_values(value, choices):
+    """ A filter value, or a list of them, from a comma separated string. Raises ValueError for values not in choices """
+    values = value.split(",")
+    for v in values:
+        if v not in choices:
+            raise ValueError("invalid choice: %r (choose from %s)" % (v, ", ".join(repr(c) for c in choices)))
+    return values[0] if len(values) == 1 else values
+
+
 def _get_args(args):
     try:
         import argparse
@@ -783,71 +3328,58 @@ def _get_args(args):
         print("ERROR: You are running Python < 2.7. Please use pip to install argparse:   pip install argparse")
 
     parser = argparse.ArgumentParser(add_help=True, description="Print out the current prices of EC2 instances")
+    parser.add_argument("command", nargs="?", help="list prices (default), serve them over HTTP, write a snapshot of them, mirror the pricing files or price an inventory", choices=COMMANDS, default="list")
     parser.add_argument("--type", "-t", help="Show elb, ondemand, reserved, spot , spotordemand or all instances prices", choices=OUTPUT_PRICE_TYPES, default="all")
-    parser.add_argument("--filter-region", "-fr", help="Filter results to a specific region", choices=EC2_REGIONS, default=None)
-    parser.add_argument("--filter-type", "-ft", help="Filter results to a specific instance type", choices=EC2_INSTANCE_TYPES, default=None)
-    parser.add_argument("--filter-type-pattern", "-fp", help="Filter results to a specific instance type pattern", choices=EC2_INSTANCE_TYPES_PATTERN, default=None)
-    parser.add_argument("--filter-os-type", "-fo", help="Filter results to a specific os type", choices=EC2_OS_TYPES, default="linux")
+    def filter_values(choices):
+        """ One of choices, or a list of several comma separated ones """
+        def parse(value):
+            try:
+                return _split_filter_values(value, choices)
+            except ValueError as e:
+                raise argparse.ArgumentTypeError(str(e))
+
+        return {"type": parse, "metavar": "{%s}" % ",".join(choices)}
+
+    parser.add_argument("--filter-region", "-fr", help="Filter results to specific regions (comma separated)", default=None, **filter_values(EC2_REGIONS))
+    parser.add_argument("--filter-type", "-ft", help="Filter results to specific instance types (comma separated)", default=None, **filter_values(EC2_INSTANCE_TYPES))
+    parser.add_argument("--filter-type-pattern", "-fp", help="Filter results to specific instance type patterns (comma separated)", default=None, **filter_values(list(EC2_INSTANCE_TYPES_PATTERN)))
+    parser.add_argument("--filter-os-type", "-fo", help="Filter results to specific os types (comma separated)", default="linux", **filter_values(EC2_OS_TYPES))
     parser.add_argument("--format", "-f", choices=OUTPUT_FORMATS, help="Output format", default="table")
+    parser.add_argument("--max-concurrency", "-mc", help="Maximum number of pricing files to download in parallel", type=int, default=DEFAULT_MAX_CONCURRENCY)
     parser.add_argument("--statsd-prefix", "-sp", help="Pass the prefix of the metric you want to have (Only for statsd output format)", default="statsd.ec2instancespricing.hourly")
+    parser.add_argument("--statsd-host", "-sh", help="Send the gauges to this statsd host over UDP instead of printing them (Only for statsd output format)", default=None)
+    parser.add_argument("--statsd-port", help="Port of --statsd-host", type=int, default=DEFAULT_STATSD_PORT)
+    parser.add_argument("--host", help="Address to listen on (Only for serve)", default="127.0.0.1")
+    parser.add_argument("--port", "-p", help="Port to listen on (Only for serve)", type=int, default=8080)
+    parser.add_argument("--snapshot-file", "-sf", help="Read prices from this snapshot instead of downloading them (the snapshot command writes it, default %s)" % DEFAULT_SNAPSHOT_FILE, default=None)
+    parser.add_argument("--base-url", "-bu", help="Download the pricing files from this base URL or mirror directory instead of AWS", default=None)
+    parser.add_argument("--mirror-directory", "-md", help="Directory to write the pricing files to (Only for mirror)", default=DEFAULT_MIRROR_DIRECTORY)
+    parser.add_argument("--changes-since", "-cs", help="Only output the prices added, changed or removed since this snapshot (e.g. the one written by the previous run of the snapshot command)", default=None)
+    parser.add_argument("--parse-processes", "-pp", help="Parse the pricing files in this many worker processes", type=int, default=None)
+    parser.add_argument("--inventory", "-i", help="CSV file of running instances with region, type, os, utilization and optionally term, count and hours (a month) columns, - for stdin (Only for cost)", default="-")
+    parser.add_argument("--group-by", "-gb", help="Add up the costs by this inventory column, or output them per row (Only for cost)", choices=COST_GROUP_BY, default="region")
+    parser.add_argument("--timings", help="Print per-stage timings and cache counters to stderr (for serve, add them to /metrics)", action="store_true", default=False)
+    parser.add_argument("--refresh-interval", help="Seconds between background refreshes (Only for serve, defaults to the cache expiration)", type=int, default=None)
 
     args = parser.parse_args(args=args)
     return args
 
 
 def _get_data(args):
-    data = {
-        "config": {
-            "currency": DEFAULT_CURRENCY,
-            "unit": "perhr"
-        },
-        "regions": list()
-    }
-
-    if args.type == "ondemand":
-        data = get_ec2_ondemand_instances_prices(args.filter_region, args.filter_type, args.filter_type_pattern, args.filter_os_type)
-    elif args.type == "reserved":
-        data = get_ec2_reserved_instances_prices(args.filter_region, args.filter_type, args.filter_type_pattern, args.filter_os_type)
-    elif args.type == "spot":
-        data = get_ec2_spot_instances_prices(args.filter_region, args.filter_type, args.filter_type_pattern, args.filter_os_type)
-    elif args.type == "spotordemand":
-        data = merge_instances(data, get_ec2_ondemand_instances_prices(args.filter_region, args.filter_type, args.filter_type_pattern, args.filter_os_type))
-        data = merge_instances(data, get_ec2_spot_instances_prices(args.filter_region, args.filter_type, args.filter_type_pattern, args.filter_os_type))
-    elif args.type == "elb":
-        data = get_elb_instances_prices(args.filter_region, args.filter_type, args.filter_type_pattern, args.filter_os_type)
-
-    elif args.type == "emr":
-        data = get_emr_instances_prices(args.filter_region, args.filter_type, args.filter_type_pattern, args.filter_os_type)
-
-    elif args.type == "all":
-        data = merge_instances(data, get_ec2_ondemand_instances_prices(args.filter_region, args.filter_type, args.filter_type_pattern, args.filter_os_type))
-        data = merge_instances(data, get_ec2_reserved_instances_prices(args.filter_region, args.filter_type, args.filter_type_pattern, args.filter_os_type))
-        data = merge_instances(data, get_ec2_spot_instances_prices(args.filter_region, args.filter_type, args.filter_type_pattern, args.filter_os_type))
-        data = merge_instances(data, get_elb_instances_prices(args.filter_region, args.filter_type, args.filter_type_pattern, args.filter_os_type))
-        data = merge_instances(data, get_emr_instances_prices(args.filter_region, args.filter_type, args.filter_type_pattern, args.filter_os_type))
-
-
-    # region -> type -> utilization
-    regions = dict()
-    for r in data["regions"]:
-        if r["region"] not in regions:
-            regions[r["region"]] = dict()
+    """ (the get_*_prices style result, its region -> type -> utilization index) the args ask for """
+    types = PRICE_TYPES_BY_OUTPUT_TYPE[args.type]
+    if len(types) > 1:
+        # one entry per region across all the price types
+        return get_prices_by_region(types, args.filter_region, args.filter_type, args.filter_type_pattern, args.filter_os_type, max_concurrency=args.max_concurrency, snapshot=args.snapshot_file)
 
-        for t in r["instanceTypes"]:
-            if t["type"] not in regions[r["region"]]:
-                regions[r["region"]][t["type"]] = dict()
-
-            assert t["utilization"] not in regions[r["region"]][t["type"]]
-            regions[r["region"]][t["type"]][t["utilization"]] = t
-
-    return data, regions
+    data = PRICE_GETTERS[types[0]](args.filter_region, args.filter_type, args.filter_type_pattern, args.filter_os_type, max_concurrency=args.max_concurrency, snapshot=args.snapshot_file)
+    return data, _index_by_region(data)
 
 
 def get_prices():
     args = _get_args([])
 
-    _, data = _get_data(args)
-    return data
+    return _get_data(args)[1]
 
 
 def merge_instances(data, data_to_merge):
@@ -866,27 +3398,128 @@ def none_as_string(v):
 def sanitize_metric(m):
     return m.replace(".","_").replace("/","SLASH").replace(" ","_").replace(":","_")
 
-if __name__ == "__main__":
-    args = _get_args(None)
 
+def statsd_metric_name(prefix, record):
+    """ prefix.region.term.type of a PriceRecord """
+    return "%s.%s.%s.%s" % (prefix, sanitize_metric(record.region), record.term, sanitize_metric(record.type))
+
+
+DEFAULT_STATSD_PORT = 8125
+
+# fits a 1500 bytes Ethernet MTU after the IP and UDP headers
+DEFAULT_STATSD_PACKET_SIZE = 1432
+
+
+class StatsdClient(object):
+    """ Sends gauges to statsd over UDP, packing as many as fit in a datagram
+        (newline separated) and sending them from a background thread.
+
+    When max_queued_packets datagrams are waiting, gauge() blocks until the
+    sender catches up.
+
+    with StatsdClient("127.0.0.1") as statsd:
+        statsd.gauge("ec2.us-east-1.spot.m1_small", 0.01)
+    """
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_STATSD_PORT, max_packet_size=DEFAULT_STATSD_PACKET_SIZE, max_queued_packets=64):
+        self.address = (host, port)
+        self.max_packet_size = max_packet_size
+        self.packets_sent = 0
+        self.metrics_sent = 0
+        self.errors = 0
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._buffer = []
+        self._buffer_size = 0
+        self._buffer_metrics = 0
+        self._lock = threading.Lock()
+        self._packets = queue.Queue(max_queued_packets)
+
+        self._sender = threading.Thread(target=self._send_loop)
+        self._sender.daemon = True
+        self._sender.start()
+
+    def gauge(self, name, value):
+        line = ("%s:%s|g" % (name, value)).encode('utf8')
+
+        with self._lock:
+            # the newline separating it from the previous line counts too
+            if self._buffer and self._buffer_size + 1 + len(line) > self.max_packet_size:
+                self._flush_buffer()
+
+            self._buffer.append(line)
+            self._buffer_size += len(line) + (1 if len(self._buffer) > 1 else 0)
+            self._buffer_metrics += 1
+
+    def flush(self):
+        """ Queue the gauges that didn't fill a datagram yet """
+        with self._lock:
+            if self._buffer:
+                self._flush_buffer()
+
+    def _flush_buffer(self):
+        self._packets.put((b"\n".join(self._buffer), self._buffer_metrics))
+        self._buffer = []
+        self._buffer_size = 0
+        self._buffer_metrics = 0
+
+    def _send_loop(self):
+        while True:
+            packet = self._packets.get()
+            if packet is None:
+                return
+
+            data, metrics = packet
+            try:
+                self._socket.sendto(data, self.address)
+                self.packets_sent += 1
+                self.metrics_sent += metrics
+            except socket.error:
+                # statsd is fire and forget, count it and carry on
+                self.errors += 1
+
+    def close(self):
+        """ Send everything still buffered, then stop the sender """
+        self.flush()
+        self._packets.put(None)
+        self._sender.join()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _list_prices(args):
     if args.format == "table":
         try:
             from prettytable import PrettyTable
         except ImportError:
             print("ERROR: Please install 'prettytable' using pip:    pip install prettytable")
 
-    data, _ = _get_data(args)
+    # stream the prices instead of building the whole result first
+    records = iter_prices(PRICE_TYPES_BY_OUTPUT_TYPE[args.type], args.filter_region, args.filter_type, args.filter_type_pattern, args.filter_os_type, max_concurrency=args.max_concurrency, snapshot=args.snapshot_file)
+
+    field_names = OUTPUT_FIELD_NAMES
+    if args.changes_since:
+        previous_records = iter_prices(PRICE_TYPES_BY_OUTPUT_TYPE[args.type], args.filter_region, args.filter_type, args.filter_type_pattern, args.filter_os_type, snapshot=args.changes_since)
+        records = diff_prices(previous_records, records)
+        field_names = ["change"] + OUTPUT_FIELD_NAMES
 
     if args.format == "json":
-        print(json.dumps(data))
+        if args.changes_since:
+            print(json.dumps([change._asdict() for change in records]))
+        else:
+            print(json.dumps(_get_data(args)[0]))
     else:
         if args.format == "table":
             x = PrettyTable()
 
             try:
-                x.set_field_names(OUTPUT_FIELD_NAMES)
+                x.set_field_names(field_names)
             except AttributeError:
-                x.field_names = OUTPUT_FIELD_NAMES
+                x.field_names = field_names
 
             try:
                 x.aligns[-1] = "l"
@@ -895,30 +3528,120 @@ if __name__ == "__main__":
                 x.align["price"] = "l"
                 x.align["upfront_perGB"] = "l"
         else:
-            x = list()
-            line_format = "%s %s %s %s %s %s %s"
+            line_format = " ".join(["%s"] * len(field_names))
             if args.format == "csv":
-                print(', '.join(OUTPUT_FIELD_NAMES))
-                line_format = "%s,%s,%s,%s,%s,%s,%s"
+                print(', '.join(field_names))
+                line_format = ",".join(["%s"] * len(field_names))
             elif args.format == "statsd":
-                line_format = "%s.%s.%s.%s:%s|g"
+                line_format = "%s:%s|g"
+
+        statsd = None
+        if args.format == "statsd" and args.statsd_host:
+            statsd = StatsdClient(args.statsd_host, args.statsd_port)
+
+        has_records = False
+        for record in records:
+            has_records = True
+            if args.format == "statsd":
+                # a gauge keeps its last value, there is nothing to send for a removed price
+                if args.changes_since and record.change == "removed":
+                    continue
+
+                if statsd is None:
+                    print(line_format % (statsd_metric_name(args.statsd_prefix, record), none_as_string(record.hourly)))
+                elif record.hourly is not None:
+                    # an empty value would make statsd drop the line
+                    statsd.gauge(statsd_metric_name(args.statsd_prefix, record), record.hourly)
+                continue
 
+            row = [record.region, record.type, record.os, none_as_string(record.hourly), record.utilization, record.term, none_as_string(record.upfront)]
+            if args.changes_since:
+                row.insert(0, record.change)
 
-        for r in data["regions"]:
-            region_name = r["region"]
-            for it in r["instanceTypes"]:
-                for term in it["prices"]:
-                    if args.format == "csv" or args.format == "line":
-                        x.append(line_format % (region_name, it["type"], it["os"], none_as_string(it["prices"][term]["hourly"]), it["utilization"], term, none_as_string(it["prices"][term]["upfront_perGB"])))
-                    elif args.format == "statsd":
-                        x.append(line_format % (args.statsd_prefix, sanitize_metric(region_name), term, sanitize_metric(it["type"]), none_as_string(it["prices"][term]["hourly"])))
-                    else:
-                        x.add_row([region_name, it["type"], it["os"], none_as_string(it["prices"][term]["hourly"]), it["utilization"], term, none_as_string(it["prices"][term]["upfront_perGB"])])
-
-        if args.format == "csv" or args.format == "line":
-            print("\n".join(x))
-        elif args.format == "statsd":
-            for metric in x:
-                print(metric)
-        else:
+            if args.format == "csv" or args.format == "line":
+                print(line_format % tuple(row))
+            else:
+                x.add_row(row)
+
+        if statsd is not None:
+            statsd.close()
+
+        if args.format == "table":
             print(x)
+        elif not has_records and (args.format == "csv" or args.format == "line"):
+            print("")
+
+
+def _list_costs(args):
+    if args.format == "statsd":
+        print("ERROR: The cost command doesn't support the statsd format")
+        return
+
+    if args.format == "table":
+        try:
+            from prettytable import PrettyTable
+        except ImportError:
+            print("ERROR: Please install 'prettytable' using pip:    pip install prettytable")
+
+    costs = fleet_cost(read_inventory(args.inventory), max_concurrency=args.max_concurrency, snapshot=args.snapshot_file)
+
+    if args.group_by == "row":
+        field_names = INVENTORY_FIELD_NAMES + ["hourly", "monthly", "annual"]
+        rows = costs.rows()
+    else:
+        field_names = list(CostTotal._fields)
+        rows = [] if args.group_by == "total" else costs.by(args.group_by)
+        rows.append(costs.total()._replace(group="total"))
+
+    if args.format == "json":
+        print(json.dumps([dict(zip(field_names, row)) for row in rows]))
+        return
+
+    if args.format == "table":
+        x = PrettyTable()
+
+        try:
+            x.set_field_names(field_names)
+        except AttributeError:
+            x.field_names = field_names
+    elif args.format == "csv":
+        print(', '.join(field_names))
+
+    for row in rows:
+        # the last three columns are the costs
+        row = ["" if v is None else ("%.4f" % v if i >= len(row) - 3 else v) for i, v in enumerate(row)]
+        if args.format == "table":
+            x.add_row(row)
+        else:
+            print((" " if args.format == "line" else ",").join(str(v) for v in row))
+
+    if args.format == "table":
+        print(x)
+
+
+if __name__ == "__main__":
+    args = _get_args(None)
+
+    if args.timings:
+        INSTRUMENTATION = Instrumentation()
+
+    if args.base_url:
+        PRICING_BASE_URL = args.base_url
+
+    if args.parse_processes:
+        PARSE_PROCESSES = args.parse_processes
+
+    if args.command == "serve":
+        serve_prices(args.host, args.port, args.refresh_interval, args.max_concurrency)
+    elif args.command == "snapshot":
+        write_snapshot(args.snapshot_file or DEFAULT_SNAPSHOT_FILE, max_concurrency=args.max_concurrency)
+    elif args.command == "mirror":
+        for path in mirror_sources(args.mirror_directory, args.max_concurrency):
+            print(path)
+    elif args.command == "cost":
+        _list_costs(args)
+    else:
+        _list_prices(args)
+
+    if args.timings:
+        INSTRUMENTATION.report()
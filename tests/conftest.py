@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the tests share the local pricing server of the benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+import localserver  # noqa: F401, puts ec2instancespricing on sys.path
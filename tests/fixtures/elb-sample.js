@@ -0,0 +1,14 @@
+/*
+ * This file is intended for use only on aws.amazon.com. We do not guarantee its availability or accuracy.
+ */
+callback({
+  vers: 0.01,
+  config: {
+    currencies: ['USD'],
+    // one entry per region
+    regions: [
+      {region: 'us-east', types: [{values: [{rate: 'perELBHour', prices: {USD: '0.025'}}, {rate: 'perGBProcessed', prices: {USD: '0.008'}},]},]},
+      {region: 'eu-ireland', types: [{values: [{rate: 'perELBHour', prices: {USD: '0.028'}}, {rate: 'perGBProcessed', prices: {USD: '0.008'}}]}]}
+    ]
+  }
+});
@@ -0,0 +1,6 @@
+/*
+ * This file is intended for use only on aws.amazon.com. We do not guarantee its availability or accuracy.
+ *
+ * Copyright 2014 Amazon.com, Inc. or its affiliates. All rights reserved.
+ */
+callback({vers:0.01,config:{rate:"perhr",valueColumns:["linux"],currencies:["USD"],regions:[{region:"us-east",instanceTypes:[{type:"generalCurrentGen",sizes:[{size:"t2.micro",vCPU:"1",ECU:"variable",memoryGiB:"1",storageGB:"ebsonly",valueColumns:[{name:"linux",prices:{USD:"0.013"}}]},{size:"m3.large",vCPU:"2",ECU:"6.5",memoryGiB:"7.5",storageGB:"1 x 32 SSD",valueColumns:[{name:"linux",prices:{USD:"0.140"}}]}]},{type:"computeCurrentGen",sizes:[{size:"c3.xlarge",vCPU:"4",ECU:"14",memoryGiB:"7.5",storageGB:"2 x 40 SSD",valueColumns:[{name:"linux",prices:{USD:"0.210"}}]}]}]},{region:"us-west-2",instanceTypes:[{type:"generalCurrentGen",sizes:[{size:"t2.micro",vCPU:"1",ECU:"variable",memoryGiB:"1",storageGB:"ebsonly",valueColumns:[{name:"linux",prices:{USD:"0.013"}}]},{size:"m3.large",vCPU:"2",ECU:"6.5",memoryGiB:"7.5",storageGB:"1 x 32 SSD",valueColumns:[{name:"linux",prices:{USD:"0.140"}}]}]}]},{region:"eu-ireland",instanceTypes:[{type:"memoryCurrentGen",sizes:[{size:"r3.large",vCPU:"2",ECU:"6.5",memoryGiB:"15",storageGB:"1 x 32 SSD",valueColumns:[{name:"linux",prices:{USD:"N/A*"}}]}]}]}]}});
@@ -0,0 +1,28 @@
+import pytest
+
+import ec2instancespricing as ec2p
+
+
+def _record(region, hourly, utilization="spot"):
+    return ec2p.PriceRecord(region, "m3.large", "linux", utilization, utilization, hourly, None)
+
+
+def test_changes_are_keyed_by_region_type_os_utilization_and_term():
+    old = [_record("us-east-1", 0.1), _record("us-west-2", 0.2), _record("eu-west-1", 0.3)]
+    new = [_record("us-east-1", 0.1), _record("us-west-2", 0.25), _record("ap-south-1", 0.4)]
+
+    changes = ec2p.diff_prices(old, new)
+
+    assert [(c.change, c.region, c.hourly, c.previous_hourly) for c in changes] == [
+        ("changed", "us-west-2", 0.25, 0.2),
+        ("added", "ap-south-1", 0.4, None),
+        ("removed", "eu-west-1", None, 0.3),
+    ]
+
+
+def test_a_whole_snapshot_is_only_compared_with_another_snapshot(tmpdir):
+    path = str(tmpdir.join("prices.snapshot"))
+    with pytest.raises(ValueError):
+        ec2p.diff_prices(path, [_record("us-east-1", 0.1)])
+    with pytest.raises(ValueError):
+        ec2p.diff_prices({"regions": []}, path)
@@ -0,0 +1,61 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+from localserver import LocalPricingServer, make_payload
+
+import ec2instancespricing as ec2p
+
+
+@pytest.fixture
+def cache(tmpdir, monkeypatch):
+    cache = ec2p.FileResultsCache()
+    monkeypatch.setattr(cache, "_cache_directory", str(tmpdir.join("cache")))
+    return cache
+
+
+def test_entries_round_trip(cache):
+    cache.set("key", {"a": 1}, {"etag": '"x"'})
+
+    assert cache.get("key") == {"a": 1}
+    assert cache.get_stale("key") == ({"a": 1}, {"etag": '"x"'})
+    assert os.stat(cache._cache_directory).st_mode & 0o777 == 0o700
+
+
+def test_directory_others_can_write_to_is_not_trusted(cache):
+    os.makedirs(cache._cache_directory)
+    os.chmod(cache._cache_directory, 0o777)
+    planted = {"key": "key", "expires": 2 ** 40, "validators": None, "value": {"planted": True}}
+    with open(os.path.join(cache._cache_directory, hashlib.sha1(b"key").hexdigest() + ".json"), "w") as f:
+        json.dump(planted, f)
+
+    assert cache.get("key") is None
+    cache.set("key", {"a": 1})
+    assert cache.get("key") is None
+    with cache.lock("key"):
+        pass
+
+
+def test_entries_that_are_not_objects_are_ignored(cache):
+    cache.set("key", {"a": 1})
+    with open(cache._path("key") + ".json", "w") as f:
+        json.dump(["not", "an", "entry"], f)
+
+    assert cache.get("key") is None
+    assert cache.get_stale("key") is None
+
+
+def test_unusable_directory_falls_back_to_fetching(cache, monkeypatch):
+    # a file where the directory should be
+    with open(cache._cache_directory, "w"):
+        pass
+
+    with LocalPricingServer() as server:
+        url = server.add("/file-cache/fallback.js", make_payload())
+        first = ec2p._load_data(url, use_cache=True, cache_class=ec2p.FileResultsCache)
+        second = ec2p._load_data(url, use_cache=True, cache_class=ec2p.FileResultsCache)
+
+    assert first == second
+    assert len(server.requests) == 2
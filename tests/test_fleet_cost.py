@@ -0,0 +1,57 @@
+import pytest
+
+from localserver import LocalPricingServer, add_all_price_types, make_elb_payload
+
+import ec2instancespricing as ec2p
+
+
+SIZES = ["m1.small", "m3.large", "c3.xlarge"]
+
+INVENTORY = {
+    "region": ["us-east-1", "us-east-1", "us-east-1", "eu-west-1", "us-west-2", "eu-north-1", "us-east-1"],
+    "type": ["m3.large", "elb", "m1.small", "c3.xlarge", "m3.large", "m3.large", "c3.xlarge"],
+    "os": ["linux", "elb", "mswin", "rhel", "linux", "linux", "linux"],
+    "utilization": ["ondemand", "elb", "spot", "heavy", "ondemand", "spot", "ondemand"],
+    "term": ["ondemand", "perGBProcessed", "spot", "1year", "ondemand", "spot", "ondemand"],
+    "count": [2, 1, 3, 1, 1, 1, 4],
+}
+
+
+@pytest.fixture
+def pricing(monkeypatch):
+    with LocalPricingServer() as server:
+        urls = add_all_price_types(server, ("us-east", "us-west-2", "eu-ireland"), SIZES)
+        urls["elb"] = [server.add("/elb.js", make_elb_payload())]
+        for type, type_urls in urls.items():
+            monkeypatch.setitem(ec2p.INSTANCES_URLS_BY_TYPE, type, type_urls)
+        yield server
+
+
+def test_filtered_prices_match_unfiltered_prices(pricing):
+    filtered = list(ec2p.fleet_cost(INVENTORY).rows())
+    unfiltered = list(ec2p.fleet_cost(INVENTORY, prices=list(ec2p.iter_prices())).rows())
+
+    assert filtered == unfiltered
+    # only the spot row in a region without spot prices is left unpriced
+    assert [row[7] is None for row in filtered] == [False, False, False, False, False, True, False]
+
+
+def test_elb_rows_default_to_the_per_gb_processed_term(pricing):
+    costs = ec2p.fleet_cost({"region": ["us-east-1"], "type": ["elb"], "os": ["elb"], "utilization": ["elb"]})
+
+    assert list(costs.rows())[0][4] == "perGBProcessed"
+    assert costs.total().unpriced == 0
+    assert costs.total().hourly == pytest.approx(0.025)
+
+
+def test_read_inventory_pads_short_rows(tmpdir):
+    path = tmpdir.join("inventory.csv")
+    path.write("region,type,os,utilization,term,count,hours\n"
+               "us-east-1,m3.large,linux,ondemand,,2,730\n"
+               "us-east-1,elb,elb,elb\n")
+
+    inventory = ec2p.read_inventory(str(path))
+
+    assert inventory["term"] == ["ondemand", "perGBProcessed"]
+    assert [float(c) for c in inventory["count"]] == [2, 1]
+    assert [float(h) for h in inventory["hours"]] == [730, ec2p.HOURS_PER_MONTH]
@@ -0,0 +1,17 @@
+import ec2instancespricing as ec2p
+
+
+def test_timed_iter_records_the_stage(monkeypatch):
+    instrumentation = ec2p.Instrumentation()
+    monkeypatch.setattr(ec2p, "INSTRUMENTATION", instrumentation)
+
+    assert list(ec2p._timed_iter("transform", [1, 2, 3])) == [1, 2, 3]
+    assert instrumentation.stats()["timings"]["transform"]["count"] == 1
+
+
+def test_timed_iter_survives_hooks_removed_before_iterating(monkeypatch):
+    monkeypatch.setattr(ec2p, "INSTRUMENTATION", ec2p.Instrumentation())
+    items = ec2p._timed_iter("transform", [1, 2, 3])
+
+    monkeypatch.setattr(ec2p, "INSTRUMENTATION", None)
+    assert list(items) == [1, 2, 3]
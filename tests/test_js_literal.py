@@ -0,0 +1,41 @@
+import glob
+import io
+import json
+import os
+import re
+
+import pytest
+
+from localserver import make_payload
+
+import ec2instancespricing as ec2p
+
+
+FIXTURES = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "*.js")))
+
+
+def _strip(request):
+    request = re.sub(re.compile(r'/\*.*\*/\n', re.DOTALL), '', request)
+    request = re.sub(r'^callback\(', '', request)
+    return re.sub(r'\);*\s*$', '', request)
+
+
+def _synthetic():
+    payload = make_payload(regions=["region-%d" % i for i in range(5)], sizes=["m%d.large" % i for i in range(10)], os_names=("linux", "mswin"))
+    return payload.replace("valueColumns:[", "valueColumns:[ // columns\n").replace("]}", ",]/* end */}")
+
+
+@pytest.mark.parametrize("path", FIXTURES, ids=os.path.basename)
+def test_lexer_matches_tokenize_fixup_on_fixtures(path):
+    text = _strip(io.open(path, encoding="utf8").read())
+    assert json.loads(ec2p.fixup_js_literal(text)) == json.loads(ec2p.fixup_js_literal_with_comments(text))
+
+
+def test_lexer_matches_tokenize_fixup_on_synthetic_payload():
+    text = _strip(_synthetic())
+    assert json.loads(ec2p.fixup_js_literal(text)) == json.loads(ec2p.fixup_js_literal_with_comments(text))
+
+
+def test_lexer_handles_quotes_keywords_and_comments():
+    text = "{a:'it\\'s \"quoted\"', b:[1, 2,], // comment\n c:true, /* block */ d:null,}"
+    assert json.loads(ec2p.fixup_js_literal(text)) == {"a": "it's \"quoted\"", "b": [1, 2], "c": True, "d": None}
@@ -0,0 +1,21 @@
+import threading
+
+from localserver import LocalPricingServer, make_payload
+
+import ec2instancespricing as ec2p
+
+
+def test_concurrent_uncached_loads_share_the_download_not_the_result():
+    with LocalPricingServer(latency=0.2) as server:
+        url = server.add("/load-data/concurrent.js", make_payload())
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(ec2p._load_data(url))) for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    assert len(server.requests) == 1
+    assert len(results) == 10
+    assert len(set(id(r) for r in results)) == 10
+    assert all(r == results[0] for r in results)
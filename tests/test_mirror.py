@@ -0,0 +1,37 @@
+import os
+
+from localserver import LocalPricingServer, add_all_price_types
+
+import ec2instancespricing as ec2p
+
+
+def test_prices_read_from_a_mirror_match_the_originals(tmpdir, monkeypatch):
+    with LocalPricingServer() as server:
+        urls = add_all_price_types(server, ("us-east", "us-west-2"), ["m1.small", "m3.large"])
+        for type, type_urls in urls.items():
+            monkeypatch.setitem(ec2p.INSTANCES_URLS_BY_TYPE, type, type_urls)
+        monkeypatch.setitem(ec2p.INSTANCES_URLS_BY_TYPE, "elb", [])
+
+        expected = ec2p.get_ec2_instances_prices(urls["ondemand"], "ondemand")
+        paths = ec2p.mirror_sources(str(tmpdir))
+
+    assert len(paths) == sum(len(u) for u in urls.values())
+    assert all(os.stat(p).st_mode & 0o444 == 0o444 for p in paths)
+
+    responses = []
+    urlopen = ec2p.urllib2.urlopen
+
+    def tracked_urlopen(url, *args, **kwargs):
+        response = urlopen(url, *args, **kwargs)
+        responses.append((response, kwargs.get("timeout")))
+        return response
+
+    monkeypatch.setattr(ec2p, "PRICING_BASE_URL", str(tmpdir))
+    monkeypatch.setattr(ec2p.urllib2, "urlopen", tracked_urlopen)
+    assert ec2p.get_ec2_instances_prices(urls["ondemand"], "ondemand") == expected
+
+    assert len(responses) == len(urls["ondemand"])
+    # every file is read with a timeout and closed afterwards
+    for response, timeout in responses:
+        assert timeout is not None
+        assert response.fp is None or response.fp.closed
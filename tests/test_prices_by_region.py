@@ -0,0 +1,61 @@
+import warnings
+
+import pytest
+
+from localserver import LocalPricingServer, add_all_price_types, make_elb_payload
+
+import ec2instancespricing as ec2p
+
+
+URL_LISTS = {
+    "ondemand": "INSTANCES_ON_DEMAND_URLS",
+    "reserved": "INSTANCES_RESERVED_URLS",
+    "spot": "INSTANCES_SPOT_URLS",
+    "elb": "INSTANCES_ELB_URLS",
+    "emr": "INSTANCES_EMR_URLS"
+}
+
+
+@pytest.fixture(scope="module")
+def pricing():
+    saved_urls = dict(ec2p.INSTANCES_URLS_BY_TYPE)
+    saved_lists = dict((name, getattr(ec2p, name)) for name in URL_LISTS.values())
+    with LocalPricingServer() as server:
+        urls = add_all_price_types(server, ("us-east", "us-west-2"), ["m1.small", "m3.large"])
+        urls["elb"] = [server.add("/elb.js", make_elb_payload(("us-east", "us-west-2")))]
+        ec2p.INSTANCES_URLS_BY_TYPE.update(urls)
+        for type, type_urls in urls.items():
+            # the get_*_prices functions read their own lists
+            setattr(ec2p, URL_LISTS[type], type_urls)
+
+        try:
+            yield server
+        finally:
+            ec2p.INSTANCES_URLS_BY_TYPE.update(saved_urls)
+            for name, value in saved_lists.items():
+                setattr(ec2p, name, value)
+
+
+@pytest.mark.parametrize("type", ["ondemand", "reserved", "spot", "elb", "emr", "spotordemand", "all"])
+def test_get_data_always_returns_the_index(pricing, type):
+    args = ec2p._get_args(["-t", type])
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        data, index = ec2p._get_data(args)
+
+    assert sorted(index) == sorted(set(r["region"] for r in data["regions"]))
+    for r in data["regions"]:
+        for it in r["instanceTypes"]:
+            assert index[r["region"]][it["type"]][it["utilization"]]["os"] in ("linux", "elb", "emr", "ec2")
+
+
+def test_collisions_keep_the_first_instance_type_and_warn(pricing):
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        data, index = ec2p.get_prices_by_region(("ondemand",), filter_os_type=("linux", "mswin"))
+
+    assert len(caught) == 1
+    assert "filter_os_type" in str(caught[0].message)
+    # the linux file comes first
+    assert index["us-east-1"]["m3.large"]["ondemand"]["os"] == "linux"
+    assert set(it["os"] for r in data["regions"] for it in r["instanceTypes"]) == set(["linux", "mswin"])
@@ -0,0 +1,25 @@
+from localserver import LocalPricingServer, add_all_price_types
+
+import ec2instancespricing as ec2p
+
+
+def test_pool_results_match_the_calling_process(monkeypatch):
+    regions = ["us-east", "region-pool"]
+    # registered after the pool processes may have started, they get it with every file
+    monkeypatch.setitem(ec2p.JSON_NAME_TO_EC2_REGIONS_API, "region-pool", "region-pool")
+
+    with LocalPricingServer() as server:
+        urls = add_all_price_types(server, regions, ["m1.small", "m3.large"])
+        expected = [ec2p.get_ec2_instances_prices(urls[type], type) for type in ("ondemand", "reserved", "spot")]
+        expected_filtered = ec2p.get_ec2_instances_prices(urls["spot"], "spot", filter_region="us-east-1", filter_instance_type="m3.large")
+
+        monkeypatch.setattr(ec2p, "PARSE_PROCESSES", 2)
+        try:
+            result = [ec2p.get_ec2_instances_prices(urls[type], type) for type in ("ondemand", "reserved", "spot")]
+            filtered = ec2p.get_ec2_instances_prices(urls["spot"], "spot", filter_region="us-east-1", filter_instance_type="m3.large")
+        finally:
+            ec2p._close_process_pool()
+
+    assert result == expected
+    assert filtered == expected_filtered
+    assert [(r["region"], len(r["instanceTypes"])) for r in filtered["regions"]] == [("us-east-1", 2)]
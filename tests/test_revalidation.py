@@ -0,0 +1,52 @@
+import datetime
+
+from localserver import LocalPricingServer, make_payload
+
+import ec2instancespricing as ec2p
+
+
+def _expire(cache, url):
+    cache._cache_expiration[url] = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+
+
+def test_not_modified_refreshes_the_expiration_without_downloading():
+    cache = ec2p.TimeBasedResultsCache()
+    with LocalPricingServer() as server:
+        url = server.add("/revalidation/unchanged.js", make_payload())
+
+        first = ec2p._load_data(url, use_cache=True, cache_class=ec2p.TimeBasedResultsCache)
+        assert cache.get_stale(url) is not None
+
+        _expire(cache, url)
+        assert cache.get(url) is None
+        second = ec2p._load_data(url, use_cache=True, cache_class=ec2p.TimeBasedResultsCache)
+
+        assert server.not_modified == 1
+        assert len(server.requests) == 2
+        # the cached payload is reused, not downloaded and parsed again
+        assert second is first
+        assert cache.get(url) is first
+
+
+def test_changed_payload_is_downloaded_again():
+    cache = ec2p.TimeBasedResultsCache()
+    with LocalPricingServer() as server:
+        url = server.add("/revalidation/changed.js", make_payload(regions=("us-east",)))
+        first = ec2p._load_data(url, use_cache=True, cache_class=ec2p.TimeBasedResultsCache)
+
+        server.add("/revalidation/changed.js", make_payload(regions=("us-east", "us-west-2")))
+        _expire(cache, url)
+        second = ec2p._load_data(url, use_cache=True, cache_class=ec2p.TimeBasedResultsCache)
+
+        assert server.not_modified == 0
+        assert [r["region"] for r in first["config"]["regions"]] == ["us-east"]
+        assert [r["region"] for r in second["config"]["regions"]] == ["us-east", "us-west-2"]
+
+
+def test_fresh_entry_is_not_revalidated():
+    with LocalPricingServer() as server:
+        url = server.add("/revalidation/fresh.js", make_payload())
+        ec2p._load_data(url, use_cache=True, cache_class=ec2p.TimeBasedResultsCache)
+        ec2p._load_data(url, use_cache=True, cache_class=ec2p.TimeBasedResultsCache)
+
+        assert len(server.requests) == 1
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from localserver import LocalPricingServer, add_all_price_types, make_elb_payload
+
+import ec2instancespricing as ec2p
+
+
+SIZES = ["m1.small", "m3.large", "c3.xlarge", "t2.micro"]
+
+TYPES = ("ondemand", "reserved", "spot", "elb", "emr")
+
+
+@pytest.fixture(scope="module")
+def snapshot(tmpdir_factory):
+    saved = dict(ec2p.INSTANCES_URLS_BY_TYPE)
+    with LocalPricingServer() as server:
+        urls = add_all_price_types(server, ("us-east", "us-west-2", "eu-ireland"), SIZES)
+        urls["elb"] = [server.add("/elb.js", make_elb_payload())]
+        ec2p.INSTANCES_URLS_BY_TYPE.update(urls)
+
+        path = str(tmpdir_factory.mktemp("snapshot").join("prices.snapshot"))
+        ec2p.write_snapshot(path)
+        try:
+            yield path
+        finally:
+            ec2p.INSTANCES_URLS_BY_TYPE.update(saved)
+
+
+@pytest.mark.parametrize("type", TYPES)
+@pytest.mark.parametrize("filters", [
+    {},
+    {"filter_os_type": "linux"},
+    {"filter_os_type": "emr"},
+    {"filter_instance_type": "m3.large"},
+    {"filter_instance_type": "m3.large,t2.micro", "filter_os_type": "linux,mswin"},
+    {"filter_region": "us-west-2"},
+])
+def test_snapshot_answers_like_the_pricing_files(snapshot, type, filters):
+    urls = ec2p.INSTANCES_URLS_BY_TYPE[type]
+    assert ec2p.get_ec2_instances_prices(urls, type, snapshot=snapshot, **filters) == ec2p.get_ec2_instances_prices(urls, type, **filters)
+
+
+def _open_files():
+    return len(os.listdir("/proc/self/fd"))
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc/self/fd")
+def test_snapshots_opened_from_a_path_are_closed(snapshot):
+    urls = ec2p.INSTANCES_URLS_BY_TYPE["spot"]
+    before = _open_files()
+    for _ in range(20):
+        ec2p.get_ec2_instances_prices(urls, "spot", snapshot=snapshot)
+        ec2p.get_prices_by_region(snapshot=snapshot)
+        list(ec2p.iter_prices(snapshot=snapshot))
+        records = ec2p.iter_prices(snapshot=snapshot)
+        next(records)
+        records.close()
+
+    assert _open_files() == before
+
+
+def test_snapshots_passed_open_are_left_open(snapshot):
+    with ec2p.PriceSnapshot(snapshot) as opened:
+        list(ec2p.iter_prices(snapshot=opened))
+        assert list(ec2p.iter_prices(snapshot=opened))
+
+
+def test_no_changes_between_a_snapshot_and_the_same_prices(snapshot):
+    assert ec2p.diff_prices(ec2p.iter_prices(["spot"], snapshot=snapshot), ec2p.iter_prices(["spot"])) == []
+    assert ec2p.diff_prices(snapshot, snapshot) == []
@@ -0,0 +1,41 @@
+from localserver import UDPListener
+
+import ec2instancespricing as ec2p
+
+
+def _records(n):
+    return [ec2p.PriceRecord("region-%d" % (i % 20), "m%d.large" % (i // 20), "linux", "spot", "spot", 0.001 * i, None) for i in range(n)]
+
+
+def test_every_gauge_arrives_batched_in_datagrams():
+    listener = UDPListener()
+    records = _records(2000)
+
+    with ec2p.StatsdClient("127.0.0.1", listener.port) as statsd:
+        for record in records:
+            statsd.gauge(ec2p.statsd_metric_name("ec2", record), record.hourly)
+    listener.wait_for(len(records))
+
+    assert listener.lines == len(records)
+    assert statsd.metrics_sent == len(records)
+    assert statsd.errors == 0
+    assert listener.datagrams == statsd.packets_sent < len(records)
+    assert listener.largest <= ec2p.DEFAULT_STATSD_PACKET_SIZE
+
+
+def test_packet_size_is_honoured():
+    listener = UDPListener()
+    records = _records(200)
+
+    with ec2p.StatsdClient("127.0.0.1", listener.port, max_packet_size=256) as statsd:
+        for record in records:
+            statsd.gauge(ec2p.statsd_metric_name("ec2", record), record.hourly)
+    listener.wait_for(len(records))
+
+    assert listener.lines == len(records)
+    assert listener.largest <= 256
+
+
+def test_metric_names_are_sanitized():
+    record = ec2p.PriceRecord("us-east-1", "m1.small", "linux", "spot", "spot", 0.01, None)
+    assert ec2p.statsd_metric_name("ec2", record) == "ec2.us-east-1.spot.m1_small"